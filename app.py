@@ -1,18 +1,48 @@
 import vertexai
-from vertexai.preview.generative_models import GenerativeModel
 import streamlit as st
 from streamlit_pdf_viewer import pdf_viewer
 import streamlit_scrollable_textbox as stx
-import pandas as pd
 import polars as pl
 import json
+import hashlib
 from pathlib import Path
-import random
-import string
 from textwrap import fill
-import PyPDF2
-import base64
-from utils.logging_utils import log_api_interaction, format_json
+import threading
+import queue
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.logging_utils import log_api_interaction, format_json, current_session_id
+from utils.log_store import get_log_store
+from services.response_cache import get_response_cache
+from services.model_backends import get_backend
+from services.scheduler import get_scheduler, is_retryable
+from utils import pdf_cache
+from utils.pdf_extraction import extract_pdfs, iter_pdf_pages
+from utils.pdf_parts import PdfPart, get_pdf_part, prompt_text, prompt_tokens
+from utils.prescreen import PRESCREEN_MIN_SCORE, ClauseScreen, derive_terms
+from utils.prompt_budget import PROMPT_TOKEN_BUDGET, plan_prompt
+from utils.contract_versions import ContractRevision, load_version, save_version, version_key
+from utils.findings_store import citation_counts, portfolio_summary, query_findings, recurring_clauses, store_findings
+from utils.reference_summaries import (
+    SUMMARY_GENERATION_CONFIG,
+    load_summary,
+    store_summary,
+    summarize_reference,
+    summary_context,
+)
+from utils.reference_registry import build_registry
+from utils.retrieval import MAX_PASSAGES, TOP_K, load_or_build_index, retrieve_context
+from utils.stream_json import StatementStreamParser
+from utils.tokens import estimate_tokens
+from utils.tracing import span, start_trace
+from utils.statements import (
+    Statement,
+    StatementValidationError,
+    build_repair_prompt,
+    load_response_schema,
+    parse_response,
+)
 import os
 from dotenv import load_dotenv
 
@@ -22,6 +52,24 @@ load_dotenv()
 # Variables
 PROJECT_ID = os.getenv("VERTEX_PROJECT_ID")
 REGION = os.getenv("VERTEX_REGION")
+MODEL_NAME = "gemini-1.5-pro"
+ALL_REFERENCES = "All References"
+MAX_TRACES = 10
+LOG_PAGE_SIZE = 10
+FINDINGS_PAGE_SIZE = 25
+# Structured output: the model is constrained to the list_of_statements schema
+ANALYSIS_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": load_response_schema(),
+}
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+CHUNK_PAGES = int(os.getenv("ANALYSIS_CHUNK_PAGES", "2"))
+INPUT_MODES = {
+    "text": "Extracted text",
+    "pdf": "Contract PDF",
+    "pdf_with_references": "Contract and reference PDFs",
+}
+DEFAULT_INPUT_MODE = os.getenv("ANALYSIS_INPUT_MODE", "text")
 
 custom_css = """
 <style>
@@ -37,13 +85,8 @@ custom_css = """
 """
 
 def extract_text_from_pdf(pdf_path):
-    """Extract text content from PDF file with page tracking"""
-    text_by_page = {}
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page_num, page in enumerate(reader.pages, 1):
-            text_by_page[page_num] = page.extract_text()
-    return text_by_page
+    """Extract text content from PDF file with page tracking, cached on disk by content hash"""
+    return extract_pdfs([pdf_path])[str(pdf_path)]
 
 def load_prompt_template():
     """Load the analysis prompt template with improved error handling"""
@@ -71,106 +114,328 @@ def load_prompt_template():
         st.error(f"Failed to load prompt template: {str(e)}")
         return "{document_text}"
 
-def analyze_document(text_dict, pdf_path, model):
-    """Analyze document using both text and PDF content"""
-    prompt_template = load_prompt_template()
-    
-    # Encode PDF as base64
-    pdf_content = encode_pdf(pdf_path)
-    
-    # Format the document text with clear separation between contract and regulations
+def format_document_text(contract_pages, regulations, contract_part=None, reference_parts=None):
+    """Format the document text with clear separation between contract and regulations.
+
+    With `contract_part` the contract pages are attached as a PDF and only their
+    numbers are named; with `reference_parts` the references are attached as PDFs.
+    """
     formatted_text = "CONTRACT TO ANALYZE:\n"
-    formatted_text += "\n".join([f"Page {page}: {content}" for page, content in text_dict["contract"].items()])
+    if contract_part:
+        formatted_text += (
+            f'The attached PDF "{contract_part.name}" holds pages '
+            f'{", ".join(str(page) for page in contract_part.source_pages)} of the contract, in that order. '
+            f'Use these page numbers for page_location.'
+        )
+    else:
+        formatted_text += "\n".join([f"Page {page}: {content}" for page, content in contract_pages.items()])
     formatted_text += "\n\nREGULATORY REFERENCES:\n"
-    for doc_name, pages in text_dict["regulations"].items():
+    if reference_parts:
+        formatted_text += "The attached PDFs " + ", ".join(f'"{part.name}"' for part in reference_parts.values())
+        return formatted_text
+    for doc_name, pages in regulations.items():
         formatted_text += f"\n{doc_name}:\n"
         formatted_text += "\n".join([f"Page {page}: {content}" for page, content in pages.items()])
+    return formatted_text
+
+def chunk_contract(contract_pages, pages_per_chunk=CHUNK_PAGES):
+    """Yield chunks of consecutive contract pages.
+
+    `contract_pages` is either a {page_num: text} dict or an iterable of
+    (page_num, text) pairs arriving in any order, e.g. from the extraction engine;
+    a chunk is yielded as soon as all of its pages have arrived.
+    """
+    if isinstance(contract_pages, dict):
+        contract_pages = contract_pages.items()
     
-    # Create input data for logging
-    input_data = {
-        "contract_name": Path(pdf_path).name,
-        "regulatory_docs": list(text_dict["regulations"].keys()),
-        "prompt_template": prompt_template
-    }
+    buffered = {}
+    next_page = 1
+    for page, text in contract_pages:
+        buffered[page] = text
+        while all(p in buffered for p in range(next_page, next_page + pages_per_chunk)):
+            yield {p: buffered.pop(p) for p in range(next_page, next_page + pages_per_chunk)}
+            next_page += pages_per_chunk
     
-    # Create the actual prompt
-    prompt = prompt_template.replace("{document_text}", formatted_text)
+    # The last chunk may be short
+    pages = sorted(buffered)
+    for i in range(0, len(pages), pages_per_chunk):
+        yield {page: buffered[page] for page in pages[i:i + pages_per_chunk]}
+
+def analyze_chunk(prompt, input_data, model, on_statement=None, fallback_prompt=None):
+    """Analyze one contract chunk with schema-constrained output.
+
+    The response is streamed and `on_statement(item)` is called for each raw
+    statement as soon as it is complete. When the model rejects a prompt with
+    attached PDFs, the chunk is analyzed again with `fallback_prompt`, its
+    extracted-text version; quota and timeout errors are raised as they are.
+    """
+    parser = StatementStreamParser()
+    pieces = []
+    with span("model_call", pages=input_data["pages"]) as stage:
+        try:
+            for piece in model.generate_stream(prompt):
+                if not pieces:
+                    stage.set(first_piece_s=round(stage.duration, 3))
+                pieces.append(piece)
+                if on_statement:
+                    for item in parser.feed(piece):
+                        on_statement(item)
+        except Exception as e:
+            # The scheduler already retried these; sending the text too would only double the load
+            if fallback_prompt is None or is_retryable(e):
+                raise
+            stage.set(fallback_to_text=str(e))
+            pieces = None
+        else:
+            response_text = "".join(pieces)
+            stage.set(
+                prompt_chars=len(prompt_text(prompt)),
+                prompt_tokens=prompt_tokens(prompt),
+                attached_pdfs=len(prompt) - 1 if not isinstance(prompt, str) else 0,
+                response_chars=len(response_text),
+                response_tokens=estimate_tokens(response_text)
+            )
+    if pieces is None:
+        log_api_interaction(input_data, "Attached PDFs failed, retrying with extracted text",
+                            [{"name": input_data["contract_name"]}])
+        return analyze_chunk(fallback_prompt, input_data, model, on_statement)
+    log_api_interaction(input_data, response_text, [{"name": input_data["contract_name"]}])
+    
+    # Output is schema-constrained, so only individual items can be invalid; repair just those
+    with span("parse_json", response_chars=len(response_text)) as stage:
+        statements, invalid = parse_response(response_text)
+        stage.set(statements=len(statements), invalid_statements=len(invalid))
+    if invalid:
+        statements += repair_statements(invalid, model, input_data)
     
+    result = {"high": [], "medium": []}
+    for statement in statements:
+        result[statement.risk_level].append(statement.as_finding())
+    return result
+
+def repair_statements(invalid, model, input_data):
+    """Send only the invalid statements back to the model, with their validation errors"""
+    repair_prompt = build_repair_prompt(invalid)
+    with span("repair", statements=len(invalid), retries=1) as stage:
+        response_text = model.generate(repair_prompt)
+        stage.set(
+            prompt_tokens=estimate_tokens(repair_prompt),
+            response_tokens=estimate_tokens(response_text)
+        )
+    log_api_interaction(
+        {"type": "repair", "contract_name": input_data["contract_name"], "prompt": repair_prompt},
+        response_text
+    )
     try:
-        response = model.generate_content(prompt)
-        log_api_interaction(input_data, response.text, [{"name": Path(pdf_path).name}])
-        result = transform_analysis_result(response.text)
-        
-        if result["high"] or result["medium"]:
-            return result
-        else:
-            clarification_prompt = """
-            Please format your previous response as a valid JSON object with this structure:
-            {
-                "list_of_statements": [
-                    {
-                        "verbatim_text": "...",
-                        "risk_level": "high|medium",
-                        "risk_reason": "...",
-                        "lower_risk_text_suggestion": "...",
-                        "page_location": 1
-                    }
-                ]
-            }
-            """
-            retry_response = model.generate_content(clarification_prompt)
+        repaired, still_invalid = parse_response(response_text)
+    except ValueError as e:
+        st.warning(f"Skipped {len(invalid)} invalid statements: {str(e)}")
+        return []
+    for _, errors in still_invalid:
+        st.warning(f"Skipped invalid statement: {'; '.join(errors)}")
+    return repaired
+
+def finding_key(finding):
+    """Identify a finding by its whitespace- and case-normalized contract text"""
+    return " ".join(finding["text"].lower().split())
+
+def merge_results(results):
+    """Merge chunk results, dropping repeated findings and keeping the highest risk level"""
+    merged = {"high": [], "medium": []}
+    seen = set()
+    for risk_level in ["high", "medium"]:
+        for result in results:
+            for item in result[risk_level]:
+                key = finding_key(item)
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged[risk_level].append(item)
+        merged[risk_level].sort(key=lambda item: item["page"])
+    return merged
+
+def analyze_document(text_dict, pdf_path, model, retrieve_regulations=None,
+                     concurrency=ANALYSIS_CONCURRENCY, on_finding=None, revision=None,
+                     contract_part=None, reference_parts=None, screen=None):
+    """Analyze the contract in page chunks, with up to `concurrency` model calls in flight.
+
+    `text_dict["contract"]` is a {page_num: text} dict or a stream of (page_num, text)
+    pairs, see chunk_contract. `model` is a ModelBackend from services.model_backends. When
+    `retrieve_regulations(chunk_pages)` is given, each chunk is sent with the regulatory
+    context relevant to its own pages instead of `text_dict["regulations"]`.
+    `on_finding(risk_level, finding)` is called on the calling thread for every new
+    finding while responses are still streaming in. With a ContractRevision only the
+    clauses changed since the previous version are sent and its stored findings for
+    unchanged clauses are carried forward. `contract_part` and `reference_parts`
+    ({name: PdfPart}) attach the PDFs themselves instead of their extracted text,
+    which is then only sent if a request with attachments fails. With a ClauseScreen
+    only the clauses passing the local pre-screen are sent.
+    """
+    prompt_template = load_prompt_template()
+    
+    # Worker threads share this script run so they can log to the session and report warnings
+    ctx = get_script_run_ctx()
+    jobs, errors, trimmed = [], [], []
+    # Contract text sent by each job, recorded on the revision once the job succeeds
+    sent_pages = []
+    results = {}
+    statements = queue.Queue()
+    streamed = set()
+    
+    def report_streamed_findings():
+        while not statements.empty():
+            try:
+                statement = Statement.from_dict(statements.get())
+            except StatementValidationError:
+                continue  # repaired once the full response is parsed
+            finding = statement.as_finding()
+            if finding_key(finding) not in streamed:
+                streamed.add(finding_key(finding))
+                on_finding(statement.risk_level, finding)
+    
+    def collect(done):
+        for future in done:
+            input_data = jobs[futures[future]]
+            try:
+                results[futures[future]] = future.result()
+                if revision:
+                    revision.mark_sent(sent_pages[futures[future]])
+            except Exception as e:
+                error_msg = f"Pages {input_data['pages']}: {str(e)}"
+                log_api_interaction(input_data, f"Error: {error_msg}", [{"name": input_data["contract_name"]}])
+                errors.append(error_msg)
+    
+    with ThreadPoolExecutor(
+        max_workers=max(1, concurrency),
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx) if ctx else None
+    ) as executor:
+        futures = {}
+        contract_pages = text_dict["contract"]
+        if revision:
+            contract_pages = revision.changed_pages(contract_pages)
+        if screen:
+            contract_pages = screen.candidate_pages(contract_pages)
+        chunks = chunk_contract(contract_pages)
+        if screen:
+            chunks = screen.pack(chunks, CHUNK_PAGES)
+        # Chunks are submitted as soon as their pages are available, while later pages are still extracting
+        for chunk_pages in chunks:
+            if revision or screen:
+                chunk_pages = {page: text for page, text in chunk_pages.items() if text}
+                if not chunk_pages:
+                    continue  # nothing changed, or nothing passed the pre-screen, in these pages
+            with span("prompt_assembly", pages=list(chunk_pages.keys())) as stage:
+                if retrieve_regulations:
+                    with span("retrieval"):
+                        regulations = retrieve_regulations(chunk_pages)
+                else:
+                    regulations = text_dict["regulations"]
+                
+                # Pack the prompt to the token budget, trimming regulations at article boundaries
+                plan = plan_prompt(prompt_template, chunk_pages, regulations, format_document_text)
+                prompt, fallback_prompt = plan.prompt, None
+                # Attached pages count as sent only as far as the text fallback holds them
+                chunk_sent = plan.contract_pages
+                if contract_part or reference_parts:
+                    # Each chunk attaches only its own contract pages; reference parts are shared
+                    chunk_part = contract_part.page_slice(chunk_pages) if contract_part else None
+                    parts = ([chunk_part] if chunk_part else []) + list((reference_parts or {}).values())
+                    attachment_tokens = prompt_tokens(parts)
+                    # Attachments that alone exceed the budget are not sent; the text prompt is used
+                    if attachment_tokens < PROMPT_TOKEN_BUDGET:
+                        plan = plan_prompt(
+                            prompt_template,
+                            {} if chunk_part else chunk_pages,
+                            {} if reference_parts else regulations,
+                            lambda contract, regs: format_document_text(
+                                contract, regs, contract_part=chunk_part, reference_parts=reference_parts
+                            ),
+                            reserved_tokens=attachment_tokens
+                        )
+                        fallback_prompt = prompt
+                        prompt = parts + [plan.prompt]
+                trimmed.extend(plan.describe_dropped())
+                stage.set(
+                    prompt_chars=len(prompt_text(prompt)),
+                    prompt_tokens=prompt_tokens(prompt),
+                    dropped_sections=len(plan.dropped),
+                    dropped_tokens=plan.dropped_tokens
+                )
+                
+                # Create input data for logging
+                input_data = {
+                    "contract_name": Path(pdf_path).name,
+                    "pages": list(chunk_pages.keys()),
+                    "regulatory_docs": list(reference_parts or plan.regulations),
+                    "attached_pdfs": [part.name for part in prompt if isinstance(part, PdfPart)]
+                    if fallback_prompt else [],
+                    "prompt_template": prompt_template,
+                    "prompt_tokens": prompt_tokens(prompt),
+                    "dropped_sections": plan.describe_dropped()
+                }
             
-            # Log the retry interaction
-            log_api_interaction(
-                {"type": "clarification", "prompt": clarification_prompt},
-                retry_response.text
+            # Each worker runs in a copy of this context so its spans land in the current trace
+            future = executor.submit(
+                contextvars.copy_context().run,
+                analyze_chunk, prompt, input_data, model,
+                statements.put if on_finding else None,
+                fallback_prompt
             )
-            
-            return transform_analysis_result(retry_response.text)
-            
-    except Exception as e:
-        error_msg = str(e)
-        log_api_interaction(input_data, f"Error: {error_msg}", [{"name": Path(pdf_path).name}])
-        return {"high": [], "medium": [], "error": error_msg}
+            futures[future] = len(jobs)
+            jobs.append(input_data)
+            sent_pages.append(chunk_sent)
+            if on_finding:
+                report_streamed_findings()
+        
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if on_finding:
+                report_streamed_findings()
+            collect(done)
+    
+    results = [results[idx] for idx in sorted(results)]
+    if errors and not results:
+        return {"high": [], "medium": [], "error": "\n".join(errors)}
+    
+    if revision:
+        # New findings come first so they win over carried ones for the same text
+        results.append(revision.carried_findings())
+    merged = merge_results(results)
+    if revision:
+        merged["revision"] = {
+            "changed_clauses": revision.changed_clauses,
+            "unchanged_clauses": revision.unchanged_clauses,
+            "carried_findings": sum(len(findings) for findings in results[-1].values()),
+        }
+    if screen:
+        merged["prescreen"] = screen.report()
+    if errors:
+        merged["chunk_errors"] = errors
+    if trimmed:
+        merged["trimmed_sections"] = trimmed
+    return merged
 
 def transform_analysis_result(result):
     """Transform the analysis result from the VertexService to the desired format"""
     try:
-        # Parse JSON string to dictionary - need to clean the response first
-        cleaned_result = result.strip().replace("```json", "").replace("```", "").strip()
-        result_dict = json.loads(cleaned_result)
-        
-        # Initialize output structure
-        output = {
-            "high": [],
-            "medium": []
-        }
-        
-        for item in result_dict.get("list_of_statements", []):
-            try:
-                risk_level = str(item.get("risk_level", "medium")).lower()
-                if risk_level in ["high", "medium"]:
-                    output[risk_level].append({
-                        "text": str(item.get("verbatim_text", "")),
-                        "suggestion": str(item.get("lower_risk_text_suggestion", "")),
-                        "analysis": str(item.get("risk_reason", "")),
-                        "page": int(item.get("page_location", 1)),
-                        "source": "main"
-                    })
-            except (ValueError, TypeError) as e:
-                st.warning(f"Skipped invalid statement: {str(e)}")
-                continue
-        
-        return output
-        
-    except json.JSONDecodeError as e:
+        statements, invalid = parse_response(result)
+    except ValueError as e:
         st.error(f"Failed to parse JSON response: {str(e)}")
         return {"high": [], "medium": []}
+    
+    for _, errors in invalid:
+        st.warning(f"Skipped invalid statement: {'; '.join(errors)}")
+    
+    output = {"high": [], "medium": []}
+    for statement in statements:
+        output[statement.risk_level].append(statement.as_finding())
+    return output
 
-def get_files_dict():
+def get_files_dict(data_folder="data", docs_folder="docs"):
     """Get dictionary of files from data and docs folders"""
-    data_folder = Path("data")
-    docs_folder = Path("docs")
+    data_folder = Path(data_folder)
+    docs_folder = Path(docs_folder)
     
     data_files = list(data_folder.glob("*.pdf"))
     docs_files = list(docs_folder.glob("*.pdf"))
@@ -182,22 +447,331 @@ def get_files_dict():
         }
     }
     
-    for doc in docs_files:
-        files_dict[f"Reference - {doc.stem}"] = {
-            "primary_party": doc.stem,
-            "path": str(doc),
+    # Identical or near-identical regulations are collapsed into one reference with aliases
+    for ref in build_registry(docs_files, extract_pdfs):
+        files_dict[f"Reference - {ref['name']}"] = {
+            "primary_party": ref["name"],
+            "path": ref["path"],
+            "aliases": ref["aliases"],
         }
     
     return files_dict
 
-def encode_pdf(pdf_path):
-    """Encode PDF file as base64 string"""
-    try:
-        with open(pdf_path, "rb") as pdf_file:
-            return base64.b64encode(pdf_file.read()).decode('utf-8')
-    except Exception as e:
-        st.error(f"Failed to encode PDF: {str(e)}")
-        return None
+def load_reference_index(files_dict, ref_docs):
+    """Load the persisted retrieval index over the reference documents"""
+    reference_hashes = {ref: pdf_cache.file_hash(files_dict[ref]["path"]) for ref in ref_docs}
+    def load_references(refs):
+        texts = extract_pdfs([files_dict[ref]["path"] for ref in refs])
+        return {ref: texts[str(files_dict[ref]["path"])] for ref in refs}
+    
+    return load_or_build_index(reference_hashes, load_references)
+
+def load_reference_summaries(files_dict, ref_docs):
+    """Return the precomputed summary records of the references that have one"""
+    summaries = {}
+    for ref in ref_docs:
+        record = load_summary(pdf_cache.file_hash(files_dict[ref]["path"]))
+        if record:
+            summaries[ref] = record
+    return summaries
+
+def load_clause_screen(files_dict, ref_docs, min_score):
+    """Build the local clause pre-screen from the vocabulary of the reference documents"""
+    texts = extract_pdfs([files_dict[ref]["path"] for ref in ref_docs])
+    return ClauseScreen(derive_terms(texts), min_score)
+
+def reference_context(reference_index, summaries, selected_refs):
+    """Build the per-chunk regulation lookup: summaries where available, retrieval otherwise"""
+    summarized = {ref: summary_context(summaries[ref]["summary"]) for ref in selected_refs if ref in summaries}
+    retrieved_refs = [ref for ref in selected_refs if ref not in summaries]
+    
+    def retrieve_regulations(pages):
+        regulations = retrieve_context(reference_index, pages, retrieved_refs) if retrieved_refs else {}
+        return {**summarized, **regulations}
+    return retrieve_regulations
+
+def store_trace(trace):
+    """Keep the most recent run traces in the session for the log tab"""
+    if "traces" not in st.session_state:
+        st.session_state.traces = []
+    st.session_state.traces.insert(0, trace)
+    del st.session_state.traces[MAX_TRACES:]
+
+def render_trace(trace):
+    """Render a run trace as a waterfall with per-stage totals and export buttons"""
+    trace_dict = trace.to_dict()
+    rows = [
+        {
+            "span": f"{item['name']} #{item['id']}",
+            "stage": item["name"],
+            "thread": item["thread"],
+            "start_ms": round(item["start_s"] * 1000, 1),
+            "end_ms": round((item["start_s"] + item["duration_s"]) * 1000, 1),
+            "duration_ms": round(item["duration_s"] * 1000, 1),
+            "attrs": format_json(item["attrs"]),
+        }
+        for item in trace_dict["spans"]
+    ]
+    st.vega_lite_chart(
+        {
+            "data": {"values": rows},
+            "mark": "bar",
+            "height": max(120, 18 * len(rows)),
+            "encoding": {
+                "y": {"field": "span", "type": "nominal", "sort": None, "title": None},
+                "x": {"field": "start_ms", "type": "quantitative", "title": "ms since start"},
+                "x2": {"field": "end_ms"},
+                "color": {"field": "stage", "type": "nominal"},
+                "tooltip": [
+                    {"field": "span"}, {"field": "thread"},
+                    {"field": "duration_ms", "type": "quantitative"}, {"field": "attrs"}
+                ],
+            },
+        },
+        width="stretch"
+    )
+    summary = trace.summary()
+    st.dataframe(
+        pl.DataFrame([{"stage": name, **values} for name, values in summary.items()], strict=False),
+        width="stretch"
+    )
+    col_json, col_chrome = st.columns(2)
+    with col_json:
+        st.download_button(
+            "Download trace (JSON)",
+            trace.to_json(),
+            file_name="trace.json",
+            mime="application/json",
+            key=f"trace_json_{trace.started_at}"
+        )
+    with col_chrome:
+        st.download_button(
+            "Download Chrome trace",
+            json.dumps(trace.to_chrome_trace()),
+            file_name="trace.chrome.json",
+            mime="application/json",
+            key=f"trace_chrome_{trace.started_at}"
+        )
+
+def reference_versions(files_dict, selected_refs, summaries):
+    """Content hashes of the selected references, marked when their summary is used instead"""
+    return sorted(
+        ("summary:" if ref in summaries else "") + pdf_cache.file_hash(files_dict[ref]["path"])
+        for ref in selected_refs
+    )
+
+def analysis_key(files_dict, main_doc, selected_refs, summaries, input_mode, prescreen_min_score):
+    """Identify an analysis by the contract content, the selected reference contents and the input settings"""
+    contract_hash = pdf_cache.file_hash(files_dict[main_doc]["path"])
+    reference_hashes = reference_versions(files_dict, selected_refs, summaries)
+    payload = json.dumps([contract_hash, reference_hashes, input_mode, prescreen_min_score])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def analysis_settings():
+    """Settings that change what the model is asked; stored contract versions are kept per settings"""
+    return {
+        "prompt_template": hashlib.sha256(load_prompt_template().encode()).hexdigest(),
+        "generation_config": ANALYSIS_GENERATION_CONFIG,
+        "chunk_pages": CHUNK_PAGES,
+        "prompt_token_budget": PROMPT_TOKEN_BUDGET,
+        "retrieval_top_k": TOP_K,
+        "retrieval_max_passages": MAX_PASSAGES,
+    }
+
+def contract_revision_key(files_dict, main_doc, selected_refs, summaries, model_name, input_mode,
+                          prescreen_min_score):
+    """Identify earlier versions of the contract, by file name, analyzed by the same model against the same references"""
+    reference_hashes = reference_versions(files_dict, selected_refs, summaries)
+    return version_key(
+        Path(files_dict[main_doc]["path"]).name, reference_hashes, model_name, input_mode, prescreen_min_score,
+        analysis_settings()
+    )
+
+def attached_parts(files_dict, main_doc, selected_refs, input_mode):
+    """Return the contract part and {reference: part} to attach for an input mode.
+
+    PDFs too large to attach are left out, so their extracted text is sent instead.
+    """
+    contract_part = get_pdf_part(files_dict[main_doc]["path"]) if input_mode != "text" else None
+    reference_parts = None
+    if input_mode == "pdf_with_references":
+        reference_parts = {}
+        for ref in selected_refs:
+            part = get_pdf_part(files_dict[ref]["path"])
+            if part is None:
+                return contract_part, None  # all references go as text so none is missing
+            reference_parts[ref] = part
+    return contract_part, reference_parts
+
+def store_analysis(key, analysis_dict):
+    """Keep analysis results in the session so reruns render them without calling the model"""
+    if "analysis_results" not in st.session_state:
+        st.session_state.analysis_results = {}
+    st.session_state.analysis_results[key] = analysis_dict
+
+def finding_widget_key(prefix, result_key, row):
+    """Stable widget key for a finding, so its widgets are reused across reruns"""
+    digest = hashlib.sha1(f"{row['page']}:{row['text']}".encode()).hexdigest()[:10]
+    return f"{prefix}_{result_key}_{digest}"
+
+def render_risk_findings(findings, prefix, result_key):
+    """Render one risk level's findings grouped by page, one page of findings at a time"""
+    df = pl.DataFrame(findings)
+    if df.is_empty():
+        return
+    
+    page_count = (len(df) + FINDINGS_PAGE_SIZE - 1) // FINDINGS_PAGE_SIZE
+    offset = 0
+    if page_count > 1:
+        results_page = st.number_input(
+            f"Results page (of {page_count})",
+            min_value=1,
+            max_value=page_count,
+            value=1,
+            key=f"{prefix}_results_page_{result_key}"
+        )
+        offset = (results_page - 1) * FINDINGS_PAGE_SIZE
+    df = df.slice(offset, FINDINGS_PAGE_SIZE)
+    
+    for page in sorted(df['page'].unique()):
+        page_items = df.filter(pl.col('page') == page)
+        with st.expander(f"Page {page}"):
+            for row in page_items.iter_rows(named=True):
+                col1, col2 = st.columns([2, 2])
+                with col1:
+                    st.markdown("**Contract Statement**")
+                    stx.scrollableTextbox(
+                        row['text'],
+                        height=200,
+                        key=finding_widget_key(f"{prefix}_text", result_key, row)
+                    )
+                with col2:
+                    st.markdown("**Suggested Version**")
+                    stx.scrollableTextbox(
+                        row['suggestion'],
+                        height=200,
+                        key=finding_widget_key(f"{prefix}_sugg", result_key, row)
+                    )
+                st.markdown("**Risk Analysis**")
+                stx.scrollableTextbox(
+                    row['analysis'],
+                    height=200,
+                    key=finding_widget_key(f"{prefix}_analysis", result_key, row)
+                )
+                st.divider()
+
+def render_analysis(analysis_dict, result_key):
+    """Render the high and medium risk findings grouped by page"""
+    if "error" in analysis_dict:
+        st.error("Failed to parse analysis results")
+        st.code(analysis_dict["error"])
+        return
+    
+    for chunk_error in analysis_dict.get("chunk_errors", []):
+        st.warning(f"Part of the contract could not be analyzed: {chunk_error}")
+    
+    revision = analysis_dict.get("revision")
+    if revision and revision["unchanged_clauses"]:
+        st.info(
+            f"Revised version: {revision['changed_clauses']} changed clauses analyzed, "
+            f"{revision['carried_findings']} findings carried forward from "
+            f"{revision['unchanged_clauses']} unchanged clauses"
+        )
+    
+    prescreen = analysis_dict.get("prescreen")
+    if prescreen and prescreen["skipped_clauses"]:
+        with st.expander(
+            f"{prescreen['skipped_clauses']} clauses ({prescreen['skipped_chars']:,} characters) "
+            f"skipped by the local pre-screen, {prescreen['candidate_clauses']} analyzed"
+        ):
+            st.dataframe(
+                pl.DataFrame(prescreen["skipped"]).sort("score", descending=True),
+                width="stretch",
+                hide_index=True
+            )
+    
+    if analysis_dict.get("trimmed_sections"):
+        with st.expander(f"{len(analysis_dict['trimmed_sections'])} sections left out to fit the prompt budget"):
+            for section in analysis_dict["trimmed_sections"]:
+                st.caption(section)
+    
+    high_risks = analysis_dict.get("high", [])
+    medium_risks = analysis_dict.get("medium", [])
+    
+    # Create tabs with count indicators
+    tab_high, tab_medium = st.tabs([
+        f"High Risk ({len(high_risks)})", 
+        f"Medium Risk ({len(medium_risks)})"
+    ])
+    
+    with tab_high:
+        render_risk_findings(high_risks, "high", result_key)
+    
+    with tab_medium:
+        render_risk_findings(medium_risks, "med", result_key)
+
+def render_reference_summary(record):
+    """Render a stored reference summary"""
+    summary = record["summary"]
+    st.subheader(summary["document_type"] or record["name"])
+    st.caption(f"Built {record['built_at'][:16].replace('T', ' ')} with {record['model']}")
+    if summary["purpose"]:
+        st.markdown(summary["purpose"])
+    if summary["summary"]:
+        st.markdown(summary["summary"])
+    
+    tab_articles, tab_obligations, tab_penalties = st.tabs([
+        f"Articles ({len(summary['articles'])})",
+        f"Obligations ({len(summary['obligations'])})",
+        f"Penalties ({len(summary['penalties'])})"
+    ])
+    for tab, field in ((tab_articles, "articles"), (tab_obligations, "obligations"), (tab_penalties, "penalties")):
+        with tab:
+            if summary[field]:
+                st.dataframe(pl.DataFrame(summary[field]), width="stretch", hide_index=True)
+            else:
+                st.caption(f"No {field} found.")
+
+def render_portfolio():
+    """Dashboards over the findings stored by every analysis run, without calling the model"""
+    summary = portfolio_summary()
+    if summary.is_empty():
+        st.info("No analyses stored yet. Findings of every run are kept here for portfolio queries.")
+        return
+
+    col_p1, col_p2, col_p3 = st.columns(3)
+    col_p1.metric("Contracts", summary.height)
+    col_p2.metric("High Risk Findings", int(summary["high"].sum()))
+    col_p3.metric("Medium Risk Findings", int(summary["medium"].sum()))
+    st.markdown("### Contracts")
+    st.dataframe(summary, width="stretch", hide_index=True)
+
+    st.markdown("### Recurring Risky Clauses")
+    st.dataframe(recurring_clauses(), width="stretch", hide_index=True)
+
+    st.markdown("### Findings by Regulation")
+    counts = citation_counts()
+    st.dataframe(counts, width="stretch", hide_index=True)
+    col_q1, col_q2 = st.columns([6, 2])
+    with col_q1:
+        citing = st.selectbox(
+            "Regulation cited",
+            counts["regulation"].to_list(),
+            index=None,
+            placeholder="Any regulation",
+            key="portfolio_citing"
+        )
+    with col_q2:
+        risk_level = st.selectbox("Risk level", ["high", "medium"], index=None,
+                                  placeholder="Any", key="portfolio_risk")
+    if citing or risk_level:
+        findings = query_findings(risk_level=risk_level, citing=citing)
+        st.caption(f"{findings.height} findings")
+        st.dataframe(
+            findings.select("contract", "risk_level", "page", "text", "analysis", "citations"),
+            width="stretch",
+            hide_index=True
+        )
 
 def main():
     vertexai.init(project=PROJECT_ID, location=REGION)
@@ -208,9 +782,10 @@ def main():
     files_dict = get_files_dict()
     
     # Main navigation tabs
-    tab_main, tab_refs, tab_log = st.tabs([
+    tab_main, tab_refs, tab_portfolio, tab_log = st.tabs([
         "Main Analysis", 
         "Reference Documents",
+        "Portfolio",
         "API Log"
     ])
     
@@ -225,7 +800,7 @@ def main():
                 if ref_docs:
                     selected_ref = st.selectbox(
                         "Select Regulatory Reference",
-                        ref_docs,
+                        [ALL_REFERENCES] + ref_docs,
                         index=0,  # Always select first reference by default
                         key="regulatory_ref"
                     )
@@ -243,6 +818,43 @@ def main():
             with col_a2:
                 main_doc = list(files_dict.keys())[0]  # Get main document
                 st.markdown(f"**Document to Analyze:** {main_doc}")
+                available_summaries = load_reference_summaries(files_dict, ref_docs)
+                use_summaries = st.checkbox(
+                    "Use reference summaries",
+                    value=False,
+                    disabled=not available_summaries,
+                    help="Send the precomputed summaries of the references instead of their full-text "
+                         "passages. Build them with `python -m build_reference_summaries`.",
+                    key="use_summaries"
+                )
+                summaries = available_summaries if use_summaries else {}
+                input_mode = st.selectbox(
+                    "Model input",
+                    list(INPUT_MODES),
+                    index=list(INPUT_MODES).index(DEFAULT_INPUT_MODE),
+                    format_func=INPUT_MODES.get,
+                    help="Attach the PDFs natively so the model sees layout and tables; "
+                         "extracted text is used when attaching fails.",
+                    key="input_mode"
+                )
+                prescreen_min_score = st.slider(
+                    "Pre-screen threshold",
+                    min_value=0.0,
+                    max_value=4.0,
+                    value=PRESCREEN_MIN_SCORE,
+                    step=0.5,
+                    help="Score each clause locally against risk rules and the vocabulary of the references, "
+                         "and send only clauses scoring at least this to the model. 0 sends every clause; "
+                         "lower values favor recall.",
+                    key="prescreen_min_score"
+                )
+                full_reanalysis = st.checkbox(
+                    "Full re-analysis",
+                    value=False,
+                    help="Send every clause to the model instead of reusing the findings stored for "
+                         "clauses unchanged since the previous version of this contract.",
+                    key="full_reanalysis"
+                )
 
         if files_dict[main_doc]["path"]:
             with st.container(border=True):
@@ -256,113 +868,106 @@ def main():
                     )
                 
                 with col_b2:
+                    selected_refs = ref_docs if selected_ref == ALL_REFERENCES else [selected_ref]
+                    result_key = analysis_key(
+                        files_dict, main_doc, selected_refs, summaries, input_mode, prescreen_min_score
+                    ) if selected_ref else None
+                    
                     if button_submit:
                         st.subheader(f"Regulatory Analysis: {files_dict[main_doc]['primary_party']}")
                         
-                        with st.spinner("Analyzing document..."):
-                            # Extract text from contract
-                            contract_text = extract_text_from_pdf(files_dict[main_doc]["path"])
+                        with start_trace(f"Analysis: {files_dict[main_doc]['primary_party']}") as trace:
+                            with st.spinner("Analyzing document..."):
+                                # Stream contract pages so chunks are analyzed while later pages are extracted
+                                contract_text = (
+                                    (page, text) for _, page, text in iter_pdf_pages([files_dict[main_doc]["path"]])
+                                )
+                            
+                                # Retrieve only the regulatory passages relevant to each contract clause
+                                reference_index = None
+                                if any(ref not in summaries for ref in selected_refs):
+                                    reference_index = load_reference_index(files_dict, ref_docs)
+                            
+                                # Regulations are retrieved per chunk below
+                                document_texts = {
+                                    "contract": contract_text,
+                                    "regulations": {}
+                                }
+                            
+                                # Findings are shown here as they stream in, then replaced by the full results
+                                live_area = st.empty()
+                                with live_area.container():
+                                    live_status = st.empty()
+                                    live_tabs = dict(zip(["high", "medium"], st.tabs(["High Risk", "Medium Risk"])))
+                                live_counts = {"high": 0, "medium": 0}
+                            
+                                def show_finding(risk_level, finding):
+                                    live_counts[risk_level] += 1
+                                    live_status.caption(
+                                        f"Findings so far: {live_counts['high']} high, {live_counts['medium']} medium"
+                                    )
+                                    with live_tabs[risk_level]:
+                                        st.markdown(f"**Page {finding['page']}:** {finding['text']}")
+                                        st.caption(finding["analysis"])
+                            
+                                # Versions are kept per backend, so a test backend's findings never carry over
+                                model = get_backend(MODEL_NAME, ANALYSIS_GENERATION_CONFIG)
                             
-                            # Extract text from all regulatory documents
-                            regulatory_texts = {}
-                            for ref_doc in ref_docs:
-                                regulatory_texts[ref_doc] = extract_text_from_pdf(files_dict[ref_doc]["path"])
+                                # Only clauses changed since the stored previous version are sent to the model
+                                revision_key = contract_revision_key(
+                                    files_dict, main_doc, selected_refs, summaries, model.model_name, input_mode,
+                                    prescreen_min_score
+                                )
+                                revision = ContractRevision(None if full_reanalysis else load_version(revision_key))
                             
-                            # Combine texts with clear structure
-                            document_texts = {
-                                "contract": contract_text,
-                                "regulations": regulatory_texts
-                            }
+                                contract_part, reference_parts = attached_parts(
+                                    files_dict, main_doc, selected_refs, input_mode
+                                )
+                                if input_mode != "text" and contract_part is None:
+                                    st.caption("The contract is too large to attach; sending its extracted text")
                             
-                            # Initialize model and get analysis
-                            model = GenerativeModel("gemini-1.5-pro")
-                            analysis_dict = analyze_document(
-                                document_texts,
-                                files_dict[main_doc]["path"],
-                                model
-                            )
+                                screen = None
+                                if prescreen_min_score:
+                                    screen = load_clause_screen(files_dict, ref_docs, prescreen_min_score)
                             
-                            if "error" not in analysis_dict:
-                                # Convert to Polars DataFrame for better handling
-                                high_risks = []
-                                medium_risks = []
-                                
-                                if "high" in analysis_dict:
-                                    high_risks = analysis_dict["high"]
-                                if "medium" in analysis_dict:
-                                    medium_risks = analysis_dict["medium"]
-                                
-                                df_high = pl.DataFrame(high_risks)
-                                df_medium = pl.DataFrame(medium_risks)
-                                
-                                # Create tabs with count indicators
-                                tab_high, tab_medium = st.tabs([
-                                    f"High Risk ({len(df_high)})", 
-                                    f"Medium Risk ({len(df_medium)})"
-                                ])
-                                
-                                # Display high risks
-                                with tab_high:
-                                    if not df_high.is_empty():
-                                        for page in sorted(df_high['page'].unique()):
-                                            page_items = df_high.filter(pl.col('page') == page)
-                                            with st.expander(f"Page {page}"):
-                                                for row in page_items.iter_rows(named=True):
-                                                    col1, col2 = st.columns([2, 2])
-                                                    with col1:
-                                                        st.markdown("**Contract Statement**")
-                                                        stx.scrollableTextbox(
-                                                            row['text'],
-                                                            height=200,
-                                                            key=f"high_text_{random.choices(string.ascii_uppercase + string.digits, k=4)}"
-                                                        )
-                                                    with col2:
-                                                        st.markdown("**Suggested Version**")
-                                                        stx.scrollableTextbox(
-                                                            row['suggestion'],
-                                                            height=200,
-                                                            key=f"high_sugg_{random.choices(string.ascii_uppercase + string.digits, k=4)}"
-                                                        )
-                                                    st.markdown("**Risk Analysis**")
-                                                    stx.scrollableTextbox(
-                                                        row['analysis'],
-                                                        height=200,
-                                                        key=f"high_analysis_{random.choices(string.ascii_uppercase + string.digits, k=4)}"
-                                                    )
-                                                    st.divider()
-                                
-                                # Display medium risks
-                                with tab_medium:
-                                    if not df_medium.is_empty():
-                                        for page in sorted(df_medium['page'].unique()):
-                                            page_items = df_medium.filter(pl.col('page') == page)
-                                            with st.expander(f"Page {page}"):
-                                                for row in page_items.iter_rows(named=True):
-                                                    col1, col2 = st.columns([2, 2])
-                                                    with col1:
-                                                        st.markdown("**Contract Statement**")
-                                                        stx.scrollableTextbox(
-                                                            row['text'],
-                                                            height=200,
-                                                            key=f"med_text_{random.choices(string.ascii_uppercase + string.digits, k=4)}"
-                                                        )
-                                                    with col2:
-                                                        st.markdown("**Suggested Version**")
-                                                        stx.scrollableTextbox(
-                                                            row['suggestion'],
-                                                            height=200,
-                                                            key=f"med_sugg_{random.choices(string.ascii_uppercase + string.digits, k=4)}"
-                                                        )
-                                                    st.markdown("**Risk Analysis**")
-                                                    stx.scrollableTextbox(
-                                                        row['analysis'],
-                                                        height=200,
-                                                        key=f"med_analysis_{random.choices(string.ascii_uppercase + string.digits, k=4)}"
-                                                    )
-                                                    st.divider()
-                            else:
-                                st.error("Failed to parse analysis results")
-                                st.code(analysis_dict["error"])
+                                # Analyze the contract chunks in parallel
+                                analysis_dict = analyze_document(
+                                    document_texts,
+                                    files_dict[main_doc]["path"],
+                                    model,
+                                    retrieve_regulations=reference_context(reference_index, summaries, selected_refs),
+                                    contract_part=contract_part,
+                                    reference_parts=reference_parts,
+                                    on_finding=show_finding,
+                                    revision=revision,
+                                    screen=screen
+                                )
+                                live_area.empty()
+                                if "error" not in analysis_dict:
+                                    store_analysis(result_key, analysis_dict)
+                                    try:
+                                        store_findings(
+                                            Path(files_dict[main_doc]["path"]).name,
+                                            pdf_cache.file_hash(files_dict[main_doc]["path"]),
+                                            analysis_dict,
+                                            model.model_name,
+                                            [files_dict[ref]["primary_party"] for ref in selected_refs]
+                                        )
+                                    except OSError as e:
+                                        st.warning(f"Findings were not added to the portfolio store: {e}")
+                                    # Clauses of failed chunks are not stored as seen, so they are retried next run
+                                    save_version(
+                                        revision_key, revision.pages, analysis_dict, revision.seen_clauses()
+                                    )
+                            
+                            with span("render"):
+                                render_analysis(analysis_dict, result_key)
+                        store_trace(trace)
+                    
+                    elif result_key in st.session_state.get("analysis_results", {}):
+                        # Reruns from other widgets render the stored results instead of re-analyzing
+                        st.subheader(f"Regulatory Analysis: {files_dict[main_doc]['primary_party']}")
+                        render_analysis(st.session_state.analysis_results[result_key], result_key)
 
     with tab_refs:
         if ref_docs:
@@ -375,6 +980,9 @@ def main():
                     key="ref_doc_selector"
                 )
                 
+                if selected_ref_doc and files_dict[selected_ref_doc]["aliases"]:
+                    st.caption("Also filed as: " + ", ".join(files_dict[selected_ref_doc]["aliases"]))
+                
                 if selected_ref_doc and files_dict[selected_ref_doc]["path"]:
                     pdf_viewer(
                         input=files_dict[selected_ref_doc]["path"],
@@ -384,41 +992,89 @@ def main():
             
             with col_r2:
                 if selected_ref_doc:
-                    analyze_button = st.button("Analyze Reference Document", key="analyze_ref")
+                    ref_path = files_dict[selected_ref_doc]["path"]
+                    summary_record = load_summary(pdf_cache.file_hash(ref_path))
                     
-                    if analyze_button:
-                        with st.spinner("Analyzing reference document..."):
-                            # Extract text from reference document
-                            ref_text = "\n".join(
-                                extract_text_from_pdf(
-                                    files_dict[selected_ref_doc]["path"]
-                                ).values()
-                            )[:8000]
-                            
-                            # Load reference analysis prompt
-                            with open("prompts/reference_analysis.md", "r", encoding="utf-8") as f:
-                                ref_prompt = f.read()
-                            
-                            # Prepare and send prompt
-                            ref_prompt = ref_prompt.replace("{document_text}", ref_text)
-                            model = GenerativeModel("gemini-1.5-pro")
-                            response = model.generate_content(ref_prompt)
-                            
-                            # Display formatted response
-                            st.markdown(response.text)
+                    if summary_record is None:
+                        st.info(
+                            "No summary has been built for this reference yet. Build all of them offline "
+                            "with `python -m build_reference_summaries`, or this one here."
+                        )
+                        if st.button("Analyze Reference Document", key="analyze_ref"):
+                            with st.spinner("Analyzing reference document..."):
+                                model = get_backend(MODEL_NAME, SUMMARY_GENERATION_CONFIG)
+                                try:
+                                    summary = summarize_reference(
+                                        files_dict[selected_ref_doc]["primary_party"],
+                                        extract_text_from_pdf(ref_path),
+                                        model
+                                    )
+                                    summary_record = store_summary(
+                                        pdf_cache.file_hash(ref_path),
+                                        files_dict[selected_ref_doc]["primary_party"],
+                                        model.model_name,
+                                        summary
+                                    )
+                                except ValueError as e:
+                                    st.error(f"Failed to parse reference analysis: {str(e)}")
+                    
+                    if summary_record:
+                        render_reference_summary(summary_record)
         else:
             st.info("No reference documents available in the docs folder.")
 
+    with tab_portfolio:
+        render_portfolio()
+
     with tab_log:
         st.subheader("Vertex API Interaction Log")
+        cache_stats = get_response_cache().stats()
+        st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        scheduler_stats = get_scheduler().stats()
+        st.caption(
+            f"Model requests: {scheduler_stats['requests']} sent, {scheduler_stats['in_flight']} in flight, "
+            f"{sum(scheduler_stats['queued'].values())} queued (peak {scheduler_stats['max_queue_depth']}), "
+            f"{scheduler_stats['retries']} retries, {scheduler_stats['failures']} failed, "
+            f"{scheduler_stats['wait_s']}s waiting for quota"
+        )
+        
+        if st.session_state.get("traces"):
+            st.markdown("### Run Timings")
+            traces = st.session_state.traces
+            selected_trace = st.selectbox(
+                "Select Run",
+                range(len(traces)),
+                format_func=lambda idx: f"[{traces[idx].started_at}] {traces[idx].name}",
+                key="trace_selector"
+            )
+            render_trace(traces[selected_trace])
+            st.markdown("### API Calls")
         
-        if 'api_logs' not in st.session_state:
+        log_store = get_log_store()
+        session_id = current_session_id()
+        total_logs = log_store.count(session_id)
+        
+        if not total_logs:
             st.info("No API interactions logged yet.")
         else:
-            for idx, log_entry in enumerate(st.session_state.api_logs):
+            page_count = (total_logs + LOG_PAGE_SIZE - 1) // LOG_PAGE_SIZE
+            log_page = st.number_input(
+                f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key="log_page"
+            )
+            offset = (log_page - 1) * LOG_PAGE_SIZE
+            for idx, header in enumerate(log_store.page(session_id, offset, LOG_PAGE_SIZE)):
                 with st.expander(
-                    f"[{log_entry['timestamp']}] API Call {len(st.session_state.api_logs) - idx}"
+                    f"[{header['timestamp']}] API Call {total_logs - offset - idx}: {header['summary']}"
                 ):
+                    # Payloads are only read from the store when asked for
+                    if not st.toggle("Show details", key=f"log_details_{header['id']}"):
+                        st.caption(f"{header['size']:,} bytes stored")
+                        continue
+                    log_entry = log_store.load(header["id"])
+                    if log_entry is None:
+                        st.info("This entry has been evicted from the log.")
+                        continue
+                    
                     # Input section
                     st.markdown("### Input")
                     st.code(format_json(log_entry["input"]), language="json")
@@ -0,0 +1,233 @@
+"""Headless batch analysis of a directory of contracts.
+
+Usage:
+    python -m batch_analysis INPUT_DIR [--output results.jsonl] [--docs docs] [--workers 4]
+                             [--input-mode text|pdf|pdf_with_references] [--prescreen-min-score 1.0]
+                             [--full]
+
+Each contract produces one JSONL record with its findings and timings. Records are
+flushed as soon as a contract finishes, and on restart contracts whose content hash
+already has a successful record in the output file are skipped, so an interrupted
+run resumes where it stopped. Findings are also added to the portfolio findings
+store (see utils/findings_store.py).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import vertexai
+
+from app import (
+    ANALYSIS_GENERATION_CONFIG,
+    DEFAULT_INPUT_MODE,
+    INPUT_MODES,
+    MODEL_NAME,
+    PROJECT_ID,
+    REGION,
+    analysis_settings,
+    analyze_document,
+    extract_text_from_pdf,
+    get_files_dict,
+    load_reference_index,
+)
+from services.model_backends import get_batch_backend
+from services.scheduler import get_scheduler
+from services.response_cache import get_response_cache
+from utils import pdf_cache
+from utils.contract_versions import ContractRevision, load_version, save_version, version_key
+from utils.findings_store import compact, store_findings
+from utils.logging_utils import configure_cli_logging
+from utils.pdf_extraction import extract_pdfs
+from utils.pdf_parts import get_pdf_part
+from utils.prescreen import PRESCREEN_MIN_SCORE, ClauseScreen, derive_terms
+from utils.retrieval import retrieve_context
+from utils.tracing import start_trace
+
+logger = logging.getLogger("batch_analysis")
+
+
+def load_checkpoint(output_path: Path, settings: dict) -> set:
+    """Return the (contract, content hash) pairs already analyzed successfully with `settings`.
+
+    Records written with another model, input mode, pre-screen threshold or set of
+    references do not count, so changing any of them analyzes every contract again.
+    """
+    done = set()
+    if not output_path.exists():
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from a crash mid-write
+            if "error" not in record and record.get("settings") == settings:
+                done.add((record["contract"], record["content_hash"]))
+    return done
+
+
+def contract_name(path: Path, input_dir: Path = None) -> str:
+    # Same-named files in different subdirectories are different contracts
+    return path.relative_to(input_dir).as_posix() if input_dir else path.name
+
+
+def run_settings(model_name: str, input_mode: str, prescreen_min_score: float, reference_hashes) -> dict:
+    """Settings stored in each record; a resumed run only skips records with the same ones"""
+    return {
+        "model": model_name,
+        "input_mode": input_mode,
+        "prescreen_min_score": prescreen_min_score,
+        "references": sorted(reference_hashes),
+    }
+
+
+def analyze_contract(path: Path, model, reference_index, ref_docs, reference_hashes, input_mode="text",
+                     reference_parts=None, ref_names=(), screen_terms=None, prescreen_min_score=0,
+                     full=False, input_dir: Path = None) -> dict:
+    """Run extraction and analysis for one contract and return its JSONL record.
+
+    Contracts are named by their path relative to `input_dir`. Contracts with a
+    stored earlier version of the same name only have their changed clauses sent
+    to the model.
+    """
+    started = time.perf_counter()
+    name = contract_name(path, input_dir)
+    record = {
+        "contract": name,
+        "path": str(path),
+        "content_hash": pdf_cache.file_hash(path),
+        "settings": run_settings(model.model_name, input_mode, prescreen_min_score, reference_hashes),
+    }
+    try:
+        with start_trace(name) as trace:
+            contract_text = extract_text_from_pdf(path)
+            extracted = time.perf_counter()
+            revision_key = version_key(
+                name, reference_hashes, model.model_name, input_mode, prescreen_min_score,
+                analysis_settings()
+            )
+            revision = ContractRevision(None if full else load_version(revision_key))
+            screen = ClauseScreen(screen_terms, prescreen_min_score) if prescreen_min_score else None
+            analysis = analyze_document(
+                {"contract": contract_text, "regulations": {}},
+                path,
+                model,
+                retrieve_regulations=lambda pages: retrieve_context(reference_index, pages, ref_docs),
+                revision=revision,
+                contract_part=get_pdf_part(path) if input_mode != "text" else None,
+                reference_parts=reference_parts,
+                screen=screen
+            )
+            finished = time.perf_counter()
+            if "error" not in analysis:
+                store_findings(name, record["content_hash"], analysis, model.model_name, ref_names)
+                # Clauses of failed chunks are not stored as seen, so they are retried next run
+                save_version(revision_key, contract_text, analysis, revision.seen_clauses())
+        record["stages"] = trace.summary()
+        record["pages"] = len(contract_text)
+        record["findings"] = {"high": analysis["high"], "medium": analysis["medium"]}
+        for key in ("error", "chunk_errors", "trimmed_sections", "revision", "prescreen"):
+            if key in analysis:
+                record[key] = analysis[key]
+        record["timings"] = {
+            "extract_s": round(extracted - started, 3),
+            "analyze_s": round(finished - extracted, 3),
+        }
+    except Exception as e:
+        record["error"] = str(e)
+    record.setdefault("timings", {})["total_s"] = round(time.perf_counter() - started, 3)
+    record["finished_at"] = datetime.now().isoformat()
+    return record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze every contract PDF in a directory")
+    parser.add_argument("input_dir", type=Path, help="Directory searched recursively for contract PDFs")
+    parser.add_argument("--output", type=Path, default=Path("batch_results.jsonl"),
+                        help="JSONL file for results, also used as the resume checkpoint")
+    parser.add_argument("--docs", type=Path, default=Path("docs"), help="Regulatory reference documents")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "4")),
+                        help="Contracts analyzed concurrently")
+    parser.add_argument("--model", default=MODEL_NAME, help="Vertex AI model name")
+    parser.add_argument("--input-mode", choices=list(INPUT_MODES), default=DEFAULT_INPUT_MODE,
+                        help="Send extracted text only, or attach the contract (and references) as PDFs")
+    parser.add_argument("--prescreen-min-score", type=float, default=PRESCREEN_MIN_SCORE,
+                        help="Only send clauses scoring at least this in the local pre-screen; 0 sends all")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-analyze every clause instead of reusing findings of unchanged clauses")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_cli_logging()
+
+    vertexai.init(project=PROJECT_ID, location=REGION)
+    model = get_batch_backend(args.model, ANALYSIS_GENERATION_CONFIG)
+
+    files_dict = get_files_dict(docs_folder=args.docs)
+    ref_docs = [k for k in files_dict if k.startswith("Reference")]
+    reference_index = load_reference_index(files_dict, ref_docs)
+    reference_hashes = [pdf_cache.file_hash(files_dict[ref]["path"]) for ref in ref_docs]
+    # Pre-screen keywords come from the references, so they are derived once for all contracts
+    screen_terms = None
+    if args.prescreen_min_score:
+        screen_terms = derive_terms(extract_pdfs([files_dict[ref]["path"] for ref in ref_docs]))
+
+    # References are the same for every contract, so their parts are mapped once
+    reference_parts = None
+    if args.input_mode == "pdf_with_references":
+        parts = {ref: get_pdf_part(files_dict[ref]["path"]) for ref in ref_docs}
+        # All references go as text if any is too large, so none is missing
+        reference_parts = parts if all(parts.values()) else None
+
+    done = load_checkpoint(
+        args.output, run_settings(model.model_name, args.input_mode, args.prescreen_min_score, reference_hashes)
+    )
+    contracts = [
+        path for path in sorted(args.input_dir.rglob("*.pdf"))
+        if (contract_name(path, args.input_dir), pdf_cache.file_hash(path)) not in done
+    ]
+    logger.info(f"{len(done)} contracts already done, {len(contracts)} to analyze")
+
+    failures = 0
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(
+                analyze_contract, path, model, reference_index, ref_docs, reference_hashes,
+                args.input_mode, reference_parts,
+                [files_dict[ref]["primary_party"] for ref in ref_docs],
+                screen_terms, args.prescreen_min_score, args.full, args.input_dir
+            ): path
+            for path in contracts
+        }
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            if "error" in record:
+                failures += 1
+                logger.error(f"{record['contract']}: {record['error']}")
+            else:
+                logger.info(
+                    f"{record['contract']}: {len(record['findings']['high'])} high, "
+                    f"{len(record['findings']['medium'])} medium in {record['timings']['total_s']}s"
+                )
+
+    # One file per contract run is written above; merge them so portfolio queries stay fast
+    logger.info(f"Findings store: merged {compact()} run files")
+    logger.info(f"Response cache: {get_response_cache().stats()}")
+    logger.info(f"Scheduler: {get_scheduler().stats()}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Benchmarks of the extraction -> prompt -> parse -> render pipeline.
+
+Usage:
+    python -m benchmark [--sizes 10 50 100 500] [--repeat 3] [--model-latency 0.05]
+                        [--baseline benchmark_baseline.json] [--save-baseline] [--tolerance 0.25]
+
+Runs on the PDFs in data/ and docs/ plus synthetic contracts of the given page
+counts, built by repeating the pages of the first contract in data/. Model calls
+go to the local fake backend with a fixed simulated latency, so results only
+depend on this code and the machine. Each case reports p50/p95 latency over the
+repeats, throughput and peak Python memory (measured in a separate traced run;
+memory of extraction worker processes is not included).
+
+The results are compared with the stored baseline and the exit code is 1 when
+a case's p50 is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import logging
+import math
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import PyPDF2
+
+from app import (
+    ANALYSIS_CONCURRENCY,
+    FINDINGS_PAGE_SIZE,
+    analyze_document,
+    extract_text_from_pdf,
+    get_files_dict,
+    load_reference_index,
+    render_analysis,
+    transform_analysis_result,
+)
+from services.model_backends import FakeBackend
+from utils import pdf_cache
+from utils.logging_utils import configure_cli_logging
+from utils.retrieval import retrieve_context
+from utils.tracing import start_trace
+
+logger = logging.getLogger("benchmark")
+
+DEFAULT_SIZES = [10, 50, 100, 500]
+RESPONSE_SIZES = [100, 1000, 10000]
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def run_case(name: str, func, units: int, unit: str, repeat: int) -> dict:
+    """Time `func` `repeat` times after a warm-up run, then measure its peak memory once.
+
+    When `func` returns a float, that is recorded as its duration instead of its wall time.
+    """
+    func()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        measured = func()
+        durations.append(measured if isinstance(measured, float) else time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50 = percentile(durations, 50)
+    result = {
+        "p50_s": round(p50, 6),
+        "p95_s": round(percentile(durations, 95), 6),
+        "throughput": round(units / p50, 2) if p50 else None,
+        "unit": f"{unit}/s",
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+    logger.info(f"{name}: p50 {result['p50_s']:.4f}s, {result['throughput']} {result['unit']}")
+    return result
+
+
+def build_synthetic_pdf(source: Path, pages: int, output: Path) -> Path:
+    """Write a PDF of `pages` pages by cycling through the pages of `source`"""
+    reader = PyPDF2.PdfReader(str(source))
+    writer = PyPDF2.PdfWriter()
+    for idx in range(pages):
+        writer.add_page(reader.pages[idx % len(reader.pages)])
+    with open(output, "wb") as f:
+        writer.write(f)
+    return output
+
+
+def synthetic_response(statements: int, seed: int = 0) -> str:
+    """A schema-valid model response with `statements` items"""
+    rng = random.Random(seed)
+    words = "cliente cartão fatura juros encargos prazo contrato pagamento limite tarifa".split()
+    return json.dumps({
+        "list_of_statements": [
+            {
+                "verbatim_text": " ".join(rng.choices(words, k=30)),
+                "risk_level": rng.choice(["high", "medium"]),
+                "risk_reason": " ".join(rng.choices(words, k=40)),
+                "lower_risk_text_suggestion": " ".join(rng.choices(words, k=30)),
+                "page_location": rng.randint(1, 500),
+            }
+            for _ in range(statements)
+        ]
+    }, ensure_ascii=False)
+
+
+def cold_extract(path: Path, cache_dir: Path):
+    """Extract with an empty page cache"""
+    def run():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        extract_text_from_pdf(path)
+    return run
+
+
+def prompt_assembly(path: Path, pages: dict, reference_index, ref_docs, model_latency: float):
+    """Analyze with the fake model and return the time spent assembling prompts"""
+    model = FakeBackend(latency=model_latency)
+
+    def run():
+        with start_trace("benchmark") as trace:
+            analyze_document(
+                {"contract": pages, "regulations": {}},
+                path,
+                model,
+                retrieve_regulations=lambda chunk: retrieve_context(reference_index, chunk, ref_docs),
+                concurrency=ANALYSIS_CONCURRENCY
+            )
+        return trace.summary()["prompt_assembly"]["duration_s"]
+    return run
+
+
+def end_to_end(path: Path, pages: dict, reference_index, ref_docs, model_latency: float):
+    model = FakeBackend(latency=model_latency)
+
+    def run():
+        analyze_document(
+            {"contract": pages, "regulations": {}},
+            path,
+            model,
+            retrieve_regulations=lambda chunk: retrieve_context(reference_index, chunk, ref_docs)
+        )
+    return run
+
+
+def run_benchmarks(args, workdir: Path) -> dict:
+    # Cold extraction must not be served from, or pollute, the real page cache
+    pdf_cache.CACHE_DIR = workdir / "pdf_text"
+
+    files_dict = get_files_dict()
+    ref_docs = [k for k in files_dict if k.startswith("Reference")]
+    reference_index = load_reference_index(files_dict, ref_docs)
+    source = Path(files_dict["Main Document"]["path"])
+
+    documents = {Path(p).name: Path(p) for p in sorted(Path("data").glob("*.pdf")) + sorted(Path("docs").glob("*.pdf"))}
+    for size in args.sizes:
+        documents[f"synthetic-{size}p"] = build_synthetic_pdf(source, size, workdir / f"synthetic-{size}.pdf")
+
+    cases = {}
+    for name, path in documents.items():
+        page_total = len(PyPDF2.PdfReader(str(path)).pages)
+        cases[f"extract_cold[{name}]"] = run_case(
+            f"extract_cold[{name}]", cold_extract(path, pdf_cache.CACHE_DIR), page_total, "pages", args.repeat
+        )
+        cases[f"extract_cached[{name}]"] = run_case(
+            f"extract_cached[{name}]", lambda: extract_text_from_pdf(path), page_total, "pages", args.repeat
+        )
+
+    for size in args.sizes:
+        path = documents[f"synthetic-{size}p"]
+        pages = extract_text_from_pdf(path)
+        cases[f"prompt_assembly[{size}p]"] = run_case(
+            f"prompt_assembly[{size}p]",
+            prompt_assembly(path, pages, reference_index, ref_docs, args.model_latency),
+            size, "pages", args.repeat
+        )
+        cases[f"analyze_fake_model[{size}p]"] = run_case(
+            f"analyze_fake_model[{size}p]",
+            end_to_end(path, pages, reference_index, ref_docs, args.model_latency),
+            size, "pages", args.repeat
+        )
+
+    for statements in RESPONSE_SIZES:
+        response = synthetic_response(statements)
+        cases[f"transform_response[{statements}]"] = run_case(
+            f"transform_response[{statements}]",
+            lambda: transform_analysis_result(response),
+            statements, "statements", args.repeat
+        )
+        analysis = transform_analysis_result(response)
+        # Each risk level shows one results page, so throughput counts only the findings rendered
+        rendered = sum(min(len(analysis[level]), FINDINGS_PAGE_SIZE) for level in ("high", "medium"))
+        cases[f"render_analysis[{statements}]"] = run_case(
+            f"render_analysis[{statements}]",
+            lambda: render_analysis(analysis, "benchmark"),
+            rendered, "findings", args.repeat
+        )
+    return cases
+
+
+def compare(cases: dict, baseline: dict, tolerance: float) -> list:
+    """Pair each case with its baseline and flag p50 slowdowns beyond the tolerance"""
+    rows = []
+    for name, result in cases.items():
+        base = baseline.get("cases", {}).get(name)
+        ratio = result["p50_s"] / base["p50_s"] if base and base["p50_s"] else None
+        rows.append((name, result, base, ratio, ratio is not None and ratio > 1 + tolerance))
+    return rows
+
+
+def print_report(rows: list):
+    header = f"{'case':<60} {'p50 s':>9} {'p95 s':>9} {'throughput':>18} {'peak MB':>8} {'vs base':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, result, base, ratio, regressed in rows:
+        throughput = f"{result['throughput']} {result['unit']}"
+        change = f"{ratio:.2f}x" if ratio is not None else "new"
+        print(
+            f"{name[:60]:<60} {result['p50_s']:>9.4f} {result['p95_s']:>9.4f} {throughput:>18} "
+            f"{result['peak_mb']:>8.2f} {change:>8}{'  REGRESSION' if regressed else ''}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the contract analysis pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Page counts of the synthetic contracts")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--model-latency", type=float, default=0.05,
+                        help="Simulated seconds per fake model call")
+    parser.add_argument("--baseline", type=Path, default=Path("benchmark_baseline.json"),
+                        help="Stored results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed p50 slowdown relative to the baseline before failing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_cli_logging()
+
+    workdir = Path(tempfile.mkdtemp(prefix="contract-benchmark-"))
+    try:
+        cases = run_benchmarks(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    rows = compare(cases, baseline, args.tolerance)
+    print_report(rows)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "repeat": args.repeat,
+            "model_latency_s": args.model_latency,
+            "cases": cases,
+        }, indent=2), encoding="utf-8")
+        logger.info(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = [name for name, *_, regressed in rows if regressed]
+    if regressions:
+        logger.error(f"{len(regressions)} cases slower than the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Build the reference summary index.
+
+Usage:
+    python -m build_reference_summaries [--docs docs] [--model gemini-1.5-pro] [--workers 4] [--force]
+
+Runs the reference analysis once per regulation and stores a structured summary
+(articles, obligations, penalties) keyed by the PDF's content hash. References
+that already have a summary are skipped unless --force is given, so the build
+only pays for new or changed regulations.
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import vertexai
+
+from app import MODEL_NAME, PROJECT_ID, REGION, extract_text_from_pdf, get_files_dict
+from services.model_backends import get_batch_backend
+from services.scheduler import get_scheduler
+from utils import pdf_cache
+from utils.logging_utils import configure_cli_logging
+from utils.reference_summaries import (
+    SUMMARY_GENERATION_CONFIG,
+    load_summary,
+    store_summary,
+    summarize_reference,
+)
+
+logger = logging.getLogger("build_reference_summaries")
+
+
+def build_summary(name: str, path: str, model) -> dict:
+    """Summarize one reference PDF and store the result"""
+    content_hash = pdf_cache.file_hash(path)
+    summary = summarize_reference(name, extract_text_from_pdf(path), model)
+    return store_summary(content_hash, name, model.model_name, summary)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute structured summaries of the reference documents")
+    parser.add_argument("--docs", default="docs", help="Regulatory reference documents")
+    parser.add_argument("--model", default=MODEL_NAME, help="Vertex AI model name")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "4")),
+                        help="References summarized concurrently")
+    parser.add_argument("--force", action="store_true", help="Rebuild summaries that already exist")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_cli_logging()
+
+    vertexai.init(project=PROJECT_ID, location=REGION)
+    model = get_batch_backend(args.model, SUMMARY_GENERATION_CONFIG)
+
+    files_dict = get_files_dict(docs_folder=args.docs)
+    references = {
+        info["primary_party"]: info["path"]
+        for key, info in files_dict.items()
+        if key.startswith("Reference")
+    }
+    pending = {
+        name: path for name, path in references.items()
+        if args.force or load_summary(pdf_cache.file_hash(path)) is None
+    }
+    logger.info(f"{len(references) - len(pending)} summaries up to date, {len(pending)} to build")
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(build_summary, name, path, model): name for name, path in pending.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                failures += 1
+                logger.error(f"{name}: {e}")
+                continue
+            summary = record["summary"]
+            logger.info(
+                f"{name}: {len(summary['articles'])} articles, {len(summary['obligations'])} obligations, "
+                f"{len(summary['penalties'])} penalties"
+            )
+    logger.info(f"Scheduler: {get_scheduler().stats()}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from services.response_cache import CachedBackend
+from services.scheduler import BATCH, INTERACTIVE, ScheduledBackend
+from utils.pdf_extraction import extract_page_range
+from utils.pdf_parts import PdfPart, prompt_text
+from utils.text_segments import split_clauses
+
+
+class ModelBackendError(Exception):
+    """Raised when a backend fails to produce a response; `retryable` errors are retried by the scheduler"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ModelBackend:
+    """Interface every model call goes through"""
+
+    model_name = None
+    generation_config = {}
+
+    def generate(self, prompt, generation_config: dict = None) -> str:
+        """Return the response text for a prompt"""
+        raise NotImplementedError
+
+    def generate_stream(self, prompt, generation_config: dict = None):
+        """Yield the response text in pieces as it is generated"""
+        yield self.generate(prompt, generation_config)
+
+
+class VertexBackend(ModelBackend):
+    """Gemini on Vertex AI"""
+
+    def __init__(self, model_name: str, generation_config: dict = None, safety_settings: list = None):
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.safety_settings = safety_settings
+        self._model = None
+
+    @property
+    def model(self):
+        # Imported lazily so the fake backend works without the Vertex SDK configured
+        if self._model is None:
+            from vertexai.generative_models import GenerativeModel, GenerationConfig
+            self._model = GenerativeModel(
+                model_name=self.model_name,
+                generation_config=GenerationConfig(**self.generation_config) if self.generation_config else None,
+                safety_settings=self.safety_settings
+            )
+        return self._model
+
+    def _generate_content(self, prompt, generation_config: dict = None, stream: bool = False):
+        if not isinstance(prompt, str):
+            prompt = [part.to_vertex() if isinstance(part, PdfPart) else part for part in prompt]
+        if generation_config:
+            from vertexai.generative_models import GenerationConfig
+            return self.model.generate_content(
+                prompt,
+                generation_config=GenerationConfig(**{**self.generation_config, **generation_config}),
+                stream=stream
+            )
+        return self.model.generate_content(prompt, stream=stream)
+
+    def generate(self, prompt, generation_config: dict = None) -> str:
+        return self._generate_content(prompt, generation_config).text
+
+    def generate_stream(self, prompt, generation_config: dict = None):
+        for chunk in self._generate_content(prompt, generation_config, stream=True):
+            yield chunk.text
+
+
+class FakeBackend(ModelBackend):
+    """Local deterministic stand-in returning schema-valid `list_of_statements` JSON.
+
+    Findings are drawn from the clauses of the contract pages in the prompt, seeded by
+    the prompt hash, so the same prompt always yields the same response. `latency` adds
+    a fixed delay per call and `failure_rate` makes that fraction of calls raise. When the
+    response schema is the reference summary schema, a summary of the articles in the
+    prompt is returned instead.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, findings_per_call: int = 3, seed: int = 0,
+                 generation_config: dict = None):
+        self.model_name = "fake"
+        self.generation_config = generation_config or {}
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.findings_per_call = findings_per_call
+        self._failures = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, generation_config: dict = None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt, generation_config)
+
+    def generate_stream(self, prompt, generation_config: dict = None):
+        """Stream the response in pieces, spreading the latency over them"""
+        response = self._respond(prompt, generation_config)
+        pieces = [response[i:i + 64] for i in range(0, len(response), 64)] or [response]
+        for piece in pieces:
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield piece
+
+    def _respond(self, prompt, generation_config: dict = None) -> str:
+        with self._lock:
+            fail = self._failures.random() < self.failure_rate
+        if fail:
+            raise ModelBackendError("Simulated backend failure", retryable=True)
+
+        text = prompt_text(prompt)
+        schema = {**self.generation_config, **(generation_config or {})}.get("response_schema") or {}
+        if "articles" in schema.get("properties", {}):
+            return self._summarize(text)
+
+        contract = text.split("REGULATORY REFERENCES:")[0]
+        clauses = []
+        for match in re.finditer(r"^Page (\d+): (.*?)(?=^Page \d+: |\Z)", contract, re.M | re.S):
+            clauses.extend((int(match.group(1)), clause) for clause in split_clauses(match.group(2)))
+        # An attached contract is read directly for the pages it holds
+        parts = [part for part in prompt if isinstance(part, PdfPart)] if not isinstance(prompt, str) else []
+        if "holds pages" in contract and parts:
+            for page in parts[0].source_pages:
+                for _, page_text in extract_page_range(parts[0].path, page, page + 1):
+                    clauses.extend((page, clause) for clause in split_clauses(page_text))
+
+        rng = random.Random(hashlib.sha256(text.encode()).hexdigest())
+        picked = rng.sample(clauses, min(self.findings_per_call, len(clauses)))
+        statements = [
+            {
+                "verbatim_text": clause,
+                "risk_level": rng.choice(["high", "medium"]),
+                "risk_reason": "Cláusula sinalizada pelo backend de teste local.",
+                "lower_risk_text_suggestion": clause,
+                "page_location": page
+            }
+            for page, clause in sorted(picked)
+        ]
+        return json.dumps({"list_of_statements": statements}, ensure_ascii=False)
+
+    def _summarize(self, text) -> str:
+        articles = []
+        for match in re.finditer(r"^Page (\d+): (.*?)(?=^Page \d+: |\Z)", text, re.M | re.S):
+            for section in re.findall(r"(?m)^[ \t]*(Art\.\s*\d+\S*)\s+(.*)$", match.group(2)):
+                articles.append({"article": section[0], "page": int(match.group(1)), "summary": section[1][:200]})
+        summary = {
+            "document_type": "Documento de referência",
+            "purpose": "Resumo gerado pelo backend de teste local.",
+            "summary": f"{len(articles)} artigos identificados.",
+            "articles": articles,
+            "obligations": [
+                {"text": item["summary"], "article": item["article"], "page": item["page"]}
+                for item in articles if "dever" in item["summary"].lower()
+            ],
+            "penalties": [],
+        }
+        return json.dumps(summary, ensure_ascii=False)
+
+
+def get_backend(model_name: str, generation_config: dict = None, safety_settings: list = None,
+                priority: int = INTERACTIVE) -> ModelBackend:
+    """Return the backend selected by MODEL_BACKEND.
+
+    Calls go through the shared request scheduler at the given priority; Vertex
+    responses are served from the cache first so cache hits use no quota.
+    """
+    if os.getenv("MODEL_BACKEND", "vertex").lower() == "fake":
+        return ScheduledBackend(
+            FakeBackend(
+                latency=float(os.getenv("FAKE_BACKEND_LATENCY_SECONDS", "0")),
+                failure_rate=float(os.getenv("FAKE_BACKEND_FAILURE_RATE", "0")),
+                generation_config=generation_config
+            ),
+            priority=priority
+        )
+    return CachedBackend(ScheduledBackend(VertexBackend(model_name, generation_config, safety_settings), priority=priority))
+
+
+def get_batch_backend(model_name: str, generation_config: dict = None) -> ModelBackend:
+    """Return the backend for offline jobs, whose requests queue behind interactive ones and
+    leave them part of the quota"""
+    return get_backend(model_name, generation_config, priority=BATCH)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from utils.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+
+def _key_default(value):
+    # Attached PDFs are identified by their content hash, not their bytes
+    content_hash = getattr(value, "content_hash", None)
+    return {"pdf": content_hash} if content_hash else str(value)
+
+
+def response_key(prompt, model_name: str, generation_config: dict = None) -> str:
+    """Hash the final prompt, model name and generation config into a cache key"""
+    payload = json.dumps(
+        {"prompt": prompt, "model": model_name, "config": generation_config or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=_key_default
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_json_object(response: str) -> bool:
+    """Whether a response is a complete JSON object, i.e. not truncated or malformed"""
+    cleaned = response.strip().replace("```json", "").replace("```", "").strip()
+    try:
+        return isinstance(json.loads(cleaned), dict)
+    except ValueError:
+        return False
+
+
+class ResponseCache:
+    """Interface for model response caches, with hit/miss counters"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, response: str):
+        pass
+
+    def lookup(self, key: str, validate=None):
+        """Get a response and update the hit/miss counters; responses failing `validate` are misses"""
+        response = self.get(key)
+        if response is not None and validate and not validate(response):
+            response = None
+        with self._stats_lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        stage = current_span()
+        if stage is not None:
+            stage.incr("cache_misses" if response is None else "cache_hits")
+        return response
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class NullResponseCache(ResponseCache):
+    """Cache that never stores anything"""
+
+
+class SQLiteResponseCache(ResponseCache):
+    """Disk-backed cache with TTL expiry and least-recently-used eviction"""
+
+    def __init__(self, path, ttl_seconds: float = None, max_entries: int = 10000):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used_at)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return response
+
+    def set(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache configured from the environment"""
+    backend = os.getenv("RESPONSE_CACHE_BACKEND", "sqlite").lower()
+    if backend == "none":
+        return NullResponseCache()
+    ttl = os.getenv("RESPONSE_CACHE_TTL_SECONDS")
+    try:
+        return SQLiteResponseCache(
+            os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3"),
+            ttl_seconds=float(ttl) if ttl else None,
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"Response cache disabled: {e}")
+        return NullResponseCache()
+
+
+class CachedBackend:
+    """Wrap a model backend so responses are served from the cache when possible.
+
+    Only responses passing `validate` are stored, so a truncated or malformed
+    response is requested again next time instead of being replayed.
+    """
+
+    def __init__(self, backend, cache: ResponseCache = None, validate=is_json_object):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.generation_config = backend.generation_config
+        self.cache = cache or get_response_cache()
+        self.validate = validate
+
+    def _store(self, key: str, response: str):
+        if self.validate(response):
+            self.cache.set(key, response)
+        else:
+            logger.warning("Model response is not valid JSON; not caching it")
+
+    def generate(self, prompt, generation_config: dict = None) -> str:
+        key = response_key(prompt, self.model_name, {**self.generation_config, **(generation_config or {})})
+        # Entries stored before validation existed may be invalid, so they are checked too
+        cached = self.cache.lookup(key, self.validate)
+        if cached is not None:
+            return cached
+        response = self.backend.generate(prompt, generation_config)
+        self._store(key, response)
+        return response
+
+    def generate_stream(self, prompt, generation_config: dict = None):
+        """Stream from the backend, or replay a cached response as a single piece"""
+        key = response_key(prompt, self.model_name, {**self.generation_config, **(generation_config or {})})
+        cached = self.cache.lookup(key, self.validate)
+        if cached is not None:
+            yield cached
+            return
+        pieces = []
+        for piece in self.backend.generate_stream(prompt, generation_config):
+            pieces.append(piece)
+            yield piece
+        self._store(key, "".join(pieces))
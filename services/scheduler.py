@@ -0,0 +1,227 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+from utils.pdf_parts import prompt_tokens
+from utils.tokens import estimate_tokens
+from utils.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Quota, overload and timeout errors are worth retrying; bad requests are not"""
+    if getattr(error, "retryable", False):
+        return True
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (
+        exceptions.TooManyRequests,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.InternalServerError,
+        exceptions.DeadlineExceeded,
+        exceptions.Aborted,
+    ))
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute with bursts up to one minute's worth; 0 means unlimited"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` of the capacity untouched"""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity * (1 - reserve)) + self.capacity * reserve
+        return max(0.0, (needed - self.level) / self.rate)
+
+    def consume(self, amount: float):
+        """Take `amount`; the level may go negative, e.g. when response tokens are charged afterwards"""
+        if self.capacity:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """Shares the model quota between every caller in the process.
+
+    Requests wait in a priority queue until the request and token buckets allow
+    them; interactive requests are served before batch ones, and batch requests
+    leave `batch_reserve` of each bucket to interactive users. Retryable errors
+    are retried with full-jitter exponential backoff.
+    """
+
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 0, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, batch_reserve: float = 0.2):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_reserve = batch_reserve
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._stats = {
+            "requests": 0, "retries": 0, "failures": 0, "in_flight": 0,
+            "max_queue_depth": 0, "wait_s": 0.0,
+        }
+
+    def _delay(self, tokens: int, priority: int) -> float:
+        reserve = self.batch_reserve if priority > INTERACTIVE else 0.0
+        return max(self.requests.wait_time(1, reserve), self.tokens.wait_time(tokens, reserve))
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE):
+        """Block until this request may be sent, then charge it to the buckets"""
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiting))
+            try:
+                while True:
+                    delay = self._delay(tokens, priority) if self._waiting[0] == ticket else None
+                    if delay == 0:
+                        break
+                    self._cond.wait(timeout=delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            waited = time.monotonic() - started
+            self._stats["requests"] += 1
+            self._stats["in_flight"] += 1
+            self._stats["wait_s"] += waited
+        span = current_span()
+        if span:
+            span.incr("queue_wait_s", round(waited, 6))
+
+    def release(self, response_tokens: int = 0):
+        """Mark a request as finished and charge its response tokens"""
+        with self._cond:
+            self._stats["in_flight"] -= 1
+            self.tokens.consume(response_tokens)
+            self._cond.notify_all()
+
+    def retry_delay(self, error: Exception, attempt: int):
+        """Return the backoff before retry number `attempt + 1`, or None if the error is final"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._cond:
+                self._stats["failures"] += 1
+            return None
+        with self._cond:
+            self._stats["retries"] += 1
+        span = current_span()
+        if span:
+            span.incr("retries")
+        logger.warning(f"Retrying model call after {type(error).__name__}: {error}")
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def run(self, func, tokens: int, priority: int = INTERACTIVE):
+        """Call `func` once the quota allows it, retrying retryable errors"""
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            try:
+                result = func()
+            except Exception as e:
+                self.release()
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.release(estimate_tokens(result) if isinstance(result, str) else 0)
+            return result
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiting:
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            return {**self._stats, "wait_s": round(self._stats["wait_s"], 3), "queued": queued}
+
+
+@lru_cache(maxsize=None)
+def get_scheduler() -> RequestScheduler:
+    """Return the process-wide scheduler configured from the environment"""
+    return RequestScheduler(
+        requests_per_minute=float(os.getenv("MODEL_REQUESTS_PER_MINUTE", "60")),
+        tokens_per_minute=float(os.getenv("MODEL_TOKENS_PER_MINUTE", "0")),
+        max_retries=int(os.getenv("MODEL_MAX_RETRIES", "5")),
+        backoff_base=float(os.getenv("MODEL_BACKOFF_BASE_SECONDS", "1")),
+        backoff_max=float(os.getenv("MODEL_BACKOFF_MAX_SECONDS", "60")),
+        batch_reserve=float(os.getenv("MODEL_BATCH_RESERVE", "0.2"))
+    )
+
+
+class ScheduledBackend:
+    """Wrap a model backend so every call goes through the request scheduler"""
+
+    def __init__(self, backend, scheduler: RequestScheduler = None, priority: int = INTERACTIVE):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.generation_config = backend.generation_config
+        self.scheduler = scheduler or get_scheduler()
+        self.priority = priority
+
+    def generate(self, prompt, generation_config: dict = None) -> str:
+        return self.scheduler.run(
+            lambda: self.backend.generate(prompt, generation_config),
+            prompt_tokens(prompt),
+            self.priority
+        )
+
+    def generate_stream(self, prompt, generation_config: dict = None):
+        """Stream a response; failures before the first piece are retried, later ones are not"""
+        tokens = prompt_tokens(prompt)
+        for attempt in itertools.count():
+            self.scheduler.acquire(tokens, self.priority)
+            stream = self.backend.generate_stream(prompt, generation_config)
+            try:
+                first = next(stream)
+            except StopIteration:
+                self.scheduler.release()
+                return
+            except Exception as e:
+                self.scheduler.release()
+                delay = self.scheduler.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            break
+
+        response_tokens = estimate_tokens(first)
+        try:
+            yield first
+            for piece in stream:
+                response_tokens += estimate_tokens(piece)
+                yield piece
+        finally:
+            self.scheduler.release(response_tokens)
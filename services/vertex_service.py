@@ -1,6 +1,7 @@
-from vertexai.generative_models import GenerativeModel, GenerationConfig, SafetySetting, HarmCategory, HarmBlockThreshold
+from vertexai.generative_models import SafetySetting, HarmCategory, HarmBlockThreshold
 import json
 import logging
+from services.model_backends import get_backend
 
 class VertexService:
     def __init__(self):
@@ -33,28 +34,17 @@ class VertexService:
         ]
         
         self.logger = logging.getLogger(__name__)
+        self.backend = get_backend("gemini-2.0-flash-001", self.generation_config, self.safety_settings)
 
     def analyze_document(self, text: str, schema: dict) -> tuple[bool, dict, str]:
         try:
-            model = GenerativeModel(
-                model_name="gemini-2.0-flash-001",
-                generation_config=GenerationConfig(**self.generation_config),
-                safety_settings=self.safety_settings
-            )
-
-            response = model.generate_content(
-                text,
-                generation_config=GenerationConfig(
-                    **self.generation_config,
-                    response_schema=schema
-                )
-            )
+            response_text = self.backend.generate(text, {"response_schema": schema})
 
             try:
-                result = json.loads(response.text)
+                result = json.loads(response_text)
                 return True, result, None
             except json.JSONDecodeError:
-                return False, None, response.text
+                return False, None, response_text
                 
         except Exception as e:
             error_msg = f"Error generating content: {str(e)}"
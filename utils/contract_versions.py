@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+
+from utils.text_segments import split_clauses
+
+VERSION_DIR = Path(os.getenv("CONTRACT_VERSION_DIR", ".cache/contract_versions"))
+# Bump when clause splitting or normalization changes so stored versions are ignored
+VERSION_FORMAT = 1
+# Word overlap above which a finding is attributed to a clause it does not quote exactly
+MIN_CLAUSE_OVERLAP = 0.5
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace so reflowed text hashes the same; accents are kept
+    because they change meaning ("e" / "é")"""
+    return " ".join(unicodedata.normalize("NFC", text or "").lower().split())
+
+
+def clause_hash(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+
+
+def version_key(contract_name: str, reference_hashes, model_name: str, input_mode: str = "text",
+                prescreen_min_score: float = 0, settings: dict = None) -> str:
+    """Identify the lineage of a contract analyzed by a model against a given set of references.
+
+    `settings` holds whatever else changes what the model is asked, such as the
+    prompt template and generation config, so changing them starts a new lineage.
+    """
+    payload = json.dumps([
+        VERSION_FORMAT, contract_name, sorted(reference_hashes), model_name, input_mode, prescreen_min_score,
+        settings or {}
+    ], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def load_version(key: str):
+    """Return the stored previous version of a contract, or None"""
+    try:
+        return json.loads((VERSION_DIR / f"{key}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", normalize(text)))
+
+
+def _find_clause(finding: dict, clauses_by_page: dict):
+    """Return the hash of the clause a finding quotes, preferring the finding's own page"""
+    quoted = normalize(finding["text"])
+    page_clauses = clauses_by_page.get(finding["page"], [])
+    for clauses in [page_clauses, *clauses_by_page.values()]:
+        for digest, text in clauses:
+            if quoted and quoted in normalize(text):
+                return digest
+
+    words = _words(finding["text"])
+    scored = [(len(words & _words(text)) / len(words), digest) for digest, text in page_clauses if words]
+    best = max(scored, default=(0, None))
+    return best[1] if best[0] >= MIN_CLAUSE_OVERLAP else None
+
+
+def save_version(key: str, contract_pages: dict, analysis: dict, seen_clauses: set = None):
+    """Store the clause hashes of a contract version with its findings attributed to clauses.
+
+    With `seen_clauses`, only those clauses are stored as analyzed, so the others
+    count as changed next time and are sent to the model then.
+    """
+    clauses_by_page = {
+        page: [(clause_hash(clause), clause) for clause in split_clauses(text)]
+        for page, text in contract_pages.items()
+    }
+    findings = []
+    for risk_level in ("high", "medium"):
+        for finding in analysis.get(risk_level, []):
+            findings.append({
+                "risk_level": risk_level,
+                "finding": finding,
+                "clause": _find_clause(finding, clauses_by_page),
+                "page_clauses": [digest for digest, _ in clauses_by_page.get(finding["page"], [])],
+            })
+    record = {
+        "pages": {
+            str(page): [digest for digest, _ in clauses if seen_clauses is None or digest in seen_clauses]
+            for page, clauses in clauses_by_page.items()
+        },
+        "findings": findings,
+    }
+    VERSION_DIR.mkdir(parents=True, exist_ok=True)
+    path = VERSION_DIR / f"{key}.json"
+    # Concurrent runs of the same contract must not share a temporary file
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class ContractRevision:
+    """Diff a new contract version against the stored previous one, clause by clause.
+
+    `changed_pages(pages)` passes the new version through, keeping only the clauses
+    whose normalized text did not exist in the previous version, so only those are
+    sent to the model. `carried_findings()` then returns the previous findings of
+    clauses that are still present, with their page numbers remapped. Without a
+    previous version every clause counts as changed. The pages seen are kept in
+    `pages` so the new version can be saved afterwards; `mark_sent(pages)` records
+    the text that actually reached the model, and `seen_clauses()` returns the
+    clauses to store as analyzed.
+    """
+
+    def __init__(self, previous: dict = None):
+        self.previous = previous or {"pages": {}, "findings": []}
+        self.previous_clauses = {digest for digests in self.previous["pages"].values() for digest in digests}
+        self.pages = {}
+        self.page_clauses = {}
+        self.sent_clauses = set()
+        self.clause_pages = {}
+        self.changed_clauses = 0
+        self.unchanged_clauses = 0
+
+    def changed_pages(self, contract_pages):
+        """Yield (page_num, text of changed clauses) for (page_num, text) pairs or a dict"""
+        if isinstance(contract_pages, dict):
+            contract_pages = contract_pages.items()
+        for page, text in contract_pages:
+            self.pages[page] = text
+            clauses = split_clauses(text)
+            self.page_clauses[page] = [(clause_hash(clause), clause) for clause in clauses]
+            changed = []
+            for digest, clause in self.page_clauses[page]:
+                self.clause_pages.setdefault(digest, page)
+                if digest in self.previous_clauses:
+                    self.unchanged_clauses += 1
+                else:
+                    self.changed_clauses += 1
+                    changed.append(clause)
+            if len(changed) == len(clauses):
+                yield page, text
+            else:
+                # Unchanged pages are still yielded, empty, so chunking keeps advancing
+                yield page, "\n".join(changed)
+
+    def mark_sent(self, sent_pages: dict):
+        """Record the clauses in {page_num: text} sent to the model in a successful request"""
+        for page, text in sent_pages.items():
+            sent = normalize(text)
+            for digest, clause in self.page_clauses.get(page, []):
+                if normalize(clause) in sent:
+                    self.sent_clauses.add(digest)
+
+    def seen_clauses(self) -> set:
+        """Clauses analyzed in this run or, unchanged, in an earlier one; trimmed, pre-screened
+        and failed clauses are left out"""
+        return self.sent_clauses | self.previous_clauses
+
+    def carried_findings(self) -> dict:
+        """Previous findings whose clause (or whole page, when unattributed) is unchanged"""
+        carried = {"high": [], "medium": []}
+        for item in self.previous["findings"]:
+            if item["clause"]:
+                new_page = self.clause_pages.get(item["clause"])
+            else:
+                new_pages = {self.clause_pages.get(digest) for digest in item["page_clauses"]}
+                new_page = new_pages.pop() if len(new_pages) == 1 else None
+            if new_page is not None:
+                carried[item["risk_level"]].append({**item["finding"], "page": new_page})
+        return carried
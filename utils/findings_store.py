@@ -0,0 +1,209 @@
+import os
+import re
+import unicodedata
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+from utils.contract_versions import normalize
+
+FINDINGS_DIR = Path(os.getenv("FINDINGS_STORE_DIR", ".cache/findings"))
+RISK_LEVELS = ("high", "medium")
+
+# "Resolução CMN nº 4.549", "Circular 3.952", "Doc 6308"; the number marker is captured
+# so that bare numbers, often years as in "Resolução de 2017", can be told apart
+CITATION_PATTERN = re.compile(
+    r"\b(resolu[çc][ãa]o|circular|doc)\b(?:\D{0,25}?\b(n[º°o.])\s*|\D{0,25}?)(\d{1,2}\.\d{3}|\d{3,5})\b",
+    re.IGNORECASE
+)
+CITATION_KINDS = {"resolucao": "Resolução", "circular": "Circular", "doc": "Doc"}
+
+SCHEMA = {
+    "run_id": pl.String,
+    "contract": pl.String,
+    "content_hash": pl.String,
+    "analyzed_at": pl.Datetime("us"),
+    "model": pl.String,
+    "references": pl.List(pl.String),
+    "risk_level": pl.String,
+    "page": pl.Int32,
+    "text": pl.String,
+    "analysis": pl.String,
+    "suggestion": pl.String,
+    "source": pl.String,
+    "clause": pl.String,
+    "citations": pl.List(pl.String),
+}
+
+
+def citations(text: str) -> list:
+    """Return the regulations cited in a text as canonical names, e.g. "Resolução 4.549" """
+    found = []
+    for kind, marker, number in CITATION_PATTERN.findall(text or ""):
+        kind = unicodedata.normalize("NFKD", kind.lower()).encode("ascii", "ignore").decode()
+        if kind != "doc" and not marker and "." not in number:
+            continue  # resolutions and circulars are numbered "4.549" or "nº 4549"
+        number = number.replace(".", "")
+        if kind != "doc":
+            number = f"{int(number):,}".replace(",", ".")
+        name = f"{CITATION_KINDS[kind]} {number}"
+        if name not in found:
+            found.append(name)
+    return found
+
+
+def _partition(contract: str, analyzed_at: datetime) -> Path:
+    slug = re.sub(r"[^\w.-]+", "_", Path(contract).with_suffix("").as_posix()).strip("_") or "contract"
+    return FINDINGS_DIR / f"contract={slug}" / f"date={analyzed_at.date().isoformat()}"
+
+
+def store_findings(contract: str, content_hash: str, analysis: dict, model_name: str,
+                   references=(), analyzed_at: datetime = None) -> Path:
+    """Write the findings of one analysis run as a Parquet file partitioned by contract and date.
+
+    Runs without findings are stored too, so the contract counts as analyzed.
+    """
+    analyzed_at = analyzed_at or datetime.now()
+    run_id = uuid.uuid4().hex
+    rows = [
+        {
+            "risk_level": risk_level,
+            "page": finding["page"],
+            "text": finding["text"],
+            "analysis": finding["analysis"],
+            "suggestion": finding["suggestion"],
+            "source": finding.get("source", "main"),
+            "clause": normalize(finding["text"]),
+            "citations": citations(f"{finding['analysis']}\n{finding['suggestion']}"),
+        }
+        for risk_level in RISK_LEVELS
+        for finding in analysis.get(risk_level, [])
+    ]
+    run = {
+        "run_id": run_id,
+        "contract": contract,
+        "content_hash": content_hash,
+        "analyzed_at": analyzed_at,
+        "model": model_name,
+        "references": list(references),
+    }
+    # An empty run keeps one row with null finding columns
+    frame = pl.DataFrame([{**run, **row} for row in rows] or [run], schema=SCHEMA)
+
+    partition = _partition(contract, analyzed_at)
+    partition.mkdir(parents=True, exist_ok=True)
+    path = partition / f"{run_id}.parquet"
+    tmp_path = path.with_suffix(".tmp")
+    frame.write_parquet(tmp_path, compression="zstd", statistics=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def scan_findings(latest_only: bool = True) -> pl.LazyFrame:
+    """Lazily scan every stored finding.
+
+    With `latest_only`, only the most recent run of each contract is kept, so
+    re-analyzed contracts are not counted twice.
+    """
+    files = sorted(FINDINGS_DIR.glob("contract=*/date=*/*.parquet"))
+    if not files:
+        return pl.LazyFrame(schema=SCHEMA)
+    frame = pl.scan_parquet(files, hive_partitioning=False)
+    if latest_only:
+        frame = frame.filter(pl.col("analyzed_at") == pl.col("analyzed_at").max().over("contract"))
+    return frame
+
+
+def query_findings(risk_level: str = None, citing: str = None, contract: str = None,
+                   latest_only: bool = True) -> pl.DataFrame:
+    """Return stored findings, optionally filtered by risk level, cited regulation and contract.
+
+    `citing` is matched against the regulations named in each finding's analysis,
+    e.g. "Resolução 4.549" or "Resolução CMN nº 4549".
+    """
+    frame = scan_findings(latest_only).filter(pl.col("risk_level").is_not_null())
+    if risk_level:
+        frame = frame.filter(pl.col("risk_level") == risk_level)
+    if contract:
+        frame = frame.filter(pl.col("contract") == contract)
+    if citing:
+        names = citations(citing) or [citing]
+        frame = frame.filter(pl.any_horizontal(pl.col("citations").list.contains(name) for name in names))
+    return frame.drop("clause").sort(["contract", "page"]).collect()
+
+
+def recurring_clauses(limit: int = 20, risk_level: str = None, latest_only: bool = True) -> pl.DataFrame:
+    """Return the flagged clauses that recur across the most contracts"""
+    frame = scan_findings(latest_only).filter(pl.col("clause").is_not_null())
+    if risk_level:
+        frame = frame.filter(pl.col("risk_level") == risk_level)
+    return (
+        frame.group_by("clause")
+        .agg(
+            pl.col("contract").n_unique().alias("contracts"),
+            pl.len().alias("findings"),
+            (pl.col("risk_level") == "high").sum().alias("high"),
+            pl.col("text").first(),
+            pl.col("citations").list.explode().drop_nulls().unique().sort().alias("citations"),
+        )
+        .sort(["contracts", "findings"], descending=True)
+        .head(limit)
+        .drop("clause")
+        .collect()
+    )
+
+
+def portfolio_summary(latest_only: bool = True) -> pl.DataFrame:
+    """Return the finding counts and last analysis time of every stored contract"""
+    return (
+        scan_findings(latest_only)
+        .group_by("contract")
+        .agg(
+            (pl.col("risk_level") == "high").sum().alias("high"),
+            (pl.col("risk_level") == "medium").sum().alias("medium"),
+            pl.col("run_id").n_unique().alias("runs"),
+            pl.col("analyzed_at").max().alias("last_analyzed"),
+        )
+        .sort(["high", "medium"], descending=True)
+        .collect()
+    )
+
+
+def citation_counts(latest_only: bool = True) -> pl.DataFrame:
+    """Return how many findings, and how many of them high risk, cite each regulation"""
+    return (
+        scan_findings(latest_only)
+        .explode("citations")
+        .filter(pl.col("citations").is_not_null())
+        .group_by(pl.col("citations").alias("regulation"))
+        .agg(
+            pl.len().alias("findings"),
+            (pl.col("risk_level") == "high").sum().alias("high"),
+            pl.col("contract").n_unique().alias("contracts"),
+        )
+        .sort("findings", descending=True)
+        .collect()
+    )
+
+
+def compact() -> int:
+    """Merge the per-run files of each partition into one file; returns the files removed.
+
+    Many small files slow scans down, so this is worth running after large batches.
+    """
+    removed = 0
+    for partition in sorted(FINDINGS_DIR.glob("contract=*/date=*")):
+        files = sorted(partition.glob("*.parquet"))
+        if len(files) < 2:
+            continue
+        merged = pl.read_parquet(files, hive_partitioning=False)
+        path = partition / f"compacted-{uuid.uuid4().hex}.parquet"
+        tmp_path = path.with_suffix(".tmp")
+        merged.write_parquet(tmp_path, compression="zstd", statistics=True)
+        os.replace(tmp_path, path)
+        for file in files:
+            file.unlink()
+        removed += len(files) - 1
+    return removed
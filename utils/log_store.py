@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+
+class LogStore:
+    """Append-only SQLite store for API interactions, capped by entry count and total size.
+
+    Payloads larger than `compress_over` bytes are stored zlib-compressed. Listing a
+    page only reads the small header columns; payloads are loaded per entry on demand.
+    """
+
+    def __init__(self, path, max_entries: int = 5000, max_bytes: int = 50 * 1024 * 1024,
+                 compress_over: int = 2048):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compress_over = compress_over
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS api_logs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, timestamp TEXT NOT NULL, "
+            "summary TEXT NOT NULL, payload BLOB NOT NULL, compressed INTEGER NOT NULL, "
+            "size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS api_logs_session ON api_logs (session_id, id)")
+        self._conn.commit()
+
+    def append(self, session_id, timestamp: str, summary: str, entry: dict):
+        payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        compressed = len(payload) > self.compress_over
+        if compressed:
+            payload = zlib.compress(payload)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO api_logs (session_id, timestamp, summary, payload, compressed, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, timestamp, summary, payload, int(compressed), len(payload))
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the oldest entries beyond the entry and size limits"""
+        row = self._conn.execute(
+            "SELECT MAX(id) FROM ("
+            "SELECT id, SUM(size) OVER (ORDER BY id DESC) AS total, "
+            "ROW_NUMBER() OVER (ORDER BY id DESC) AS position FROM api_logs"
+            ") WHERE total > ? OR position > ?",
+            (self.max_bytes, self.max_entries)
+        ).fetchone()
+        if row[0] is not None:
+            self._conn.execute("DELETE FROM api_logs WHERE id <= ?", (row[0],))
+
+    def count(self, session_id) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM api_logs WHERE session_id IS ?", (session_id,)
+            ).fetchone()[0]
+
+    def page(self, session_id, offset: int, limit: int) -> list:
+        """Return entry headers for a session, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, timestamp, summary, size FROM api_logs WHERE session_id IS ? "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, limit, offset)
+            ).fetchall()
+        return [{"id": r[0], "timestamp": r[1], "summary": r[2], "size": r[3]} for r in rows]
+
+    def load(self, entry_id: int):
+        """Return the full logged entry, or None if it has been evicted"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, compressed FROM api_logs WHERE id = ?", (entry_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        payload, compressed = row
+        return json.loads(zlib.decompress(payload) if compressed else payload)
+
+
+@lru_cache(maxsize=None)
+def get_log_store() -> LogStore:
+    """Return the process-wide API log store configured from the environment"""
+    return LogStore(
+        os.getenv("API_LOG_PATH", ".cache/api_logs.sqlite3"),
+        max_entries=int(os.getenv("API_LOG_MAX_ENTRIES", "5000")),
+        max_bytes=int(os.getenv("API_LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+        compress_over=int(os.getenv("API_LOG_COMPRESS_OVER_BYTES", "2048"))
+    )
@@ -1,11 +1,30 @@
 import json
+import logging
 from datetime import datetime
-import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from utils.log_store import get_log_store
+
+logger = logging.getLogger(__name__)
+
+def configure_cli_logging():
+    """Log to stderr for the command line tools, without Streamlit's warnings about
+    the missing script context that the pipeline helpers trigger"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
 
 def log_api_interaction(input_data: dict, response: str, files: list = None):
     """Log API interaction with Vertex"""
-    if 'api_logs' not in st.session_state:
-        st.session_state.api_logs = []
+    if not runtime.exists():
+        # Headless runs (batch CLI) have no session to show the log in
+        logger.debug(
+            "API interaction for %s: %d response chars",
+            input_data.get("contract_name", input_data.get("type")),
+            len(response or "")
+        )
+        return
     
     timestamp = datetime.now().isoformat()
     
@@ -16,7 +35,19 @@ def log_api_interaction(input_data: dict, response: str, files: list = None):
         "response": response
     }
     
-    st.session_state.api_logs.insert(0, log_entry)  # Add to beginning of list
+    summary = str(input_data.get("contract_name", input_data.get("type", "request")))
+    if "pages" in input_data:
+        summary += f" pages {input_data['pages']}"
+    if input_data.get("type"):
+        summary += f" ({input_data['type']})"
+    
+    # Kept off the session so long-lived sessions do not accumulate full prompts in memory
+    get_log_store().append(current_session_id(), timestamp, summary, log_entry)
+
+def current_session_id():
+    """Return the Streamlit session id of the running script, or None outside a session"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
 
 def format_json(data):
     """Format JSON data for display"""
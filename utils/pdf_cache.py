@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", ".cache/pdf_text"))
+MAX_CACHE_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# (path, size, mtime) -> content hash, so unchanged files are not re-hashed on every rerun
+_hash_memo = {}
+
+
+def file_hash(path) -> str:
+    """Return the SHA-256 of a file's content, memoized on size and mtime"""
+    stat = os.stat(path)
+    memo_key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def cache_key(path, extractor_version: str) -> str:
+    """Build the cache key from the file content hash and the extractor version"""
+    return hashlib.sha256(f"{extractor_version}:{file_hash(path)}".encode()).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.json"
+
+
+def load_pages(key: str):
+    """Return the cached {page_num: text} dict for a key, or None on a miss"""
+    entry = _entry_path(key)
+    try:
+        with open(entry, "r", encoding="utf-8") as f:
+            pages = json.load(f)
+        os.utime(entry)  # mark as recently used for LRU eviction
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable PDF cache entry {entry}: {e}")
+        return None
+    return {int(page): text for page, text in pages.items()}
+
+
+def store_pages(key: str, pages: dict):
+    """Persist extracted pages for a key and enforce the cache size limit"""
+    entry = _entry_path(key)
+    tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False)
+        os.replace(tmp, entry)
+        evict(MAX_CACHE_BYTES)
+    except OSError as e:
+        logger.warning(f"Failed to write PDF cache entry {entry}: {e}")
+
+
+def evict(max_bytes: int):
+    """Delete least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    for entry in CACHE_DIR.glob("*.json"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            entry.unlink()
+            total -= size
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,146 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import PyPDF2
+
+from utils import pdf_cache
+from utils.tracing import span
+
+# Bump when the extraction logic changes so cached page text is invalidated
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}-1"
+
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+MAX_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Documents with at most this many pages are parsed inline; a process round-trip costs more
+INLINE_PAGE_LIMIT = int(os.getenv("PDF_INLINE_PAGE_LIMIT", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Return the shared extraction process pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, because forking the multi-threaded Streamlit server is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, MAX_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Drop a pool broken by a crashed worker, so the next extraction starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def page_count(path) -> int:
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_page_range(path, start: int, stop: int) -> list:
+    """Extract pages [start, stop) (1-based) as [(page_num, text)]; runs in a worker process"""
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [(page_num, reader.pages[page_num - 1].extract_text()) for page_num in range(start, stop)]
+
+
+def iter_pdf_pages(paths, max_workers: int = MAX_WORKERS, pages_per_task: int = PAGES_PER_TASK):
+    """Yield (path, page_num, text) for every page of every PDF as soon as it is extracted.
+
+    Cached documents are yielded first, straight from the page cache. Large uncached
+    documents are split into page ranges farmed out to a process pool; at most two
+    ranges per worker are in flight, which bounds the memory held by parsed pages no
+    matter how large a manual is. Pages arrive in completion order, in order within
+    each range. Completed documents are written to the page cache.
+    """
+    pending_docs = {}
+    for path in map(str, paths):
+        key = pdf_cache.cache_key(path, EXTRACTOR_VERSION)
+        cached = pdf_cache.load_pages(key)
+        if cached is not None:
+            with span("extract_pdf", document=Path(path).name, pages=len(cached), cache_hits=1):
+                pass  # recorded so cache hits show up in the run trace
+            for page_num in sorted(cached):
+                yield path, page_num, cached[page_num]
+        else:
+            pending_docs[path] = key
+
+    inline_tasks, pooled_tasks = [], []
+    for path in pending_docs:
+        total = page_count(path)
+        if total <= INLINE_PAGE_LIMIT or max_workers <= 1:
+            inline_tasks.append((path, 1, total + 1))
+        else:
+            pooled_tasks.extend(
+                (path, start, min(start + pages_per_task, total + 1))
+                for start in range(1, total + 1, pages_per_task)
+            )
+
+    pages_by_doc = {path: {} for path in pending_docs}
+    remaining = {path: 0 for path in pending_docs}
+    for path, _, _ in inline_tasks + pooled_tasks:
+        remaining[path] += 1
+
+    def finish(path, pages):
+        pages_by_doc[path].update(pages)
+        remaining[path] -= 1
+        if remaining[path] == 0:
+            pdf_cache.store_pages(pending_docs[path], pages_by_doc.pop(path))
+
+    def extract_inline(tasks):
+        # Spans never stay open across a yield, so they only time extraction itself
+        for path, start, stop in tasks:
+            with span("extract_pdf", document=Path(path).name, pages=stop - start, cache_misses=1):
+                pages = extract_page_range(path, start, stop)
+            finish(path, pages)
+            yield from ((path, page_num, text) for page_num, text in pages)
+
+    yield from extract_inline(inline_tasks)
+
+    max_in_flight = 2 * max(1, max_workers)
+    in_flight = {}
+    while pooled_tasks or in_flight:
+        pool = _get_pool()
+        try:
+            while pooled_tasks and len(in_flight) < max_in_flight:
+                task = pooled_tasks[0]
+                in_flight[pool.submit(extract_page_range, *task)] = task
+                pooled_tasks.pop(0)
+            with span("extract_pdf", in_flight=len(in_flight)) as stage:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                results = [(in_flight[future], future.result()) for future in done]
+                stage.set(pages=sum(len(pages) for _, pages in results))
+        except BrokenProcessPool:
+            # A worker died, e.g. out of memory on a huge manual, and took the pool with it;
+            # the ranges not yet extracted are parsed inline instead
+            _discard_pool(pool)
+            yield from extract_inline(list(in_flight.values()) + pooled_tasks)
+            return
+        for future in done:
+            del in_flight[future]
+        for (path, _, _), pages in results:
+            finish(path, pages)
+            for page_num, text in pages:
+                yield path, page_num, text
+
+
+def extract_pdfs(paths) -> dict:
+    """Extract several PDFs in parallel into {path: {page_num: text}}"""
+    documents = {str(path): {} for path in paths}
+    for path, page_num, text in iter_pdf_pages(documents):
+        documents[path][page_num] = text
+    return {path: dict(sorted(pages.items())) for path, pages in documents.items()}
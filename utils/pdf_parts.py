@@ -0,0 +1,103 @@
+import io
+import mmap
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import PyPDF2
+
+from utils.pdf_cache import file_hash
+from utils.pdf_extraction import page_count
+from utils.tokens import estimate_tokens
+
+# Inline request data is limited, larger PDFs fall back to extracted text
+MAX_PART_BYTES = int(os.getenv("PDF_PART_MAX_BYTES", str(20 * 1024 * 1024)))
+# Tokens the model charges per attached PDF page
+TOKENS_PER_PAGE = 258
+
+
+class PdfPart:
+    """A PDF attached natively to a model request.
+
+    The file is memory-mapped once and the same part is shared by every request
+    that attaches it, so the bytes are neither re-read nor re-encoded per call.
+    `page_slice(pages)` returns a part holding only some pages, so a chunk request
+    is not charged for the whole document.
+    """
+
+    mime_type = "application/pdf"
+
+    def __init__(self, path, content_hash: str, data=None, source_pages: tuple = None):
+        self.path = str(path)
+        self.name = Path(path).name
+        self.content_hash = content_hash
+        # Page numbers of the original document held by this part, in order
+        self.source_pages = source_pages or tuple(range(1, page_count(path) + 1))
+        self.pages = len(self.source_pages)
+        if data is None:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = data
+        self._vertex_part = None
+        self._slices = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def to_vertex(self):
+        """Return the Vertex AI part for this PDF, built once"""
+        if self._vertex_part is None:
+            from vertexai.generative_models import Part
+            self._vertex_part = Part.from_data(data=self.data[:], mime_type=self.mime_type)
+        return self._vertex_part
+
+    def page_slice(self, pages) -> "PdfPart":
+        """Return a part with only the given pages of this document, built once per page set"""
+        pages = tuple(pages)
+        if pages == self.source_pages:
+            return self
+        if pages not in self._slices:
+            reader = PyPDF2.PdfReader(io.BytesIO(self.data))
+            writer = PyPDF2.PdfWriter()
+            for page in pages:
+                writer.add_page(reader.pages[self.source_pages.index(page)])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            self._slices[pages] = PdfPart(
+                self.path,
+                f"{self.content_hash}:{','.join(map(str, pages))}",
+                data=buffer.getvalue(),
+                source_pages=pages
+            )
+        return self._slices[pages]
+
+    def __repr__(self):
+        return f"PdfPart({self.name!r}, {self.pages} pages)"
+
+
+@lru_cache(maxsize=32)
+def _load_part(path: str, content_hash: str) -> PdfPart:
+    return PdfPart(path, content_hash)
+
+
+def get_pdf_part(path):
+    """Return the shared part for a PDF, or None when it is too large to attach inline"""
+    if os.path.getsize(path) > MAX_PART_BYTES:
+        return None
+    # Keyed by content hash so an edited file is mapped again
+    return _load_part(str(path), file_hash(path))
+
+
+def prompt_text(prompt) -> str:
+    """The text of a prompt that is either a string or a list of text and PDF parts"""
+    return prompt if isinstance(prompt, str) else "\n".join(p for p in prompt if isinstance(p, str))
+
+
+def prompt_tokens(prompt) -> int:
+    """Estimated tokens of a prompt, counting attached PDFs per page"""
+    if isinstance(prompt, str):
+        return estimate_tokens(prompt)
+    return estimate_tokens(prompt_text(prompt)) + sum(
+        part.pages * TOKENS_PER_PAGE for part in prompt if isinstance(part, PdfPart)
+    )
@@ -0,0 +1,150 @@
+import os
+import re
+import unicodedata
+from collections import Counter
+
+from utils.retrieval import STOPWORDS, tokenize
+from utils.text_segments import split_clauses, split_sections
+
+# Clauses scoring below this are not sent to the model; 0 sends every clause
+PRESCREEN_MIN_SCORE = float(os.getenv("PRESCREEN_MIN_SCORE", "0"))
+# Regulation keywords matched besides the rules, and their share of the score
+MAX_DERIVED_TERMS = 80
+TERM_WEIGHT = 0.25
+MAX_TERM_SCORE = 0.5
+
+# Risk topics of credit card contracts, matched on lowercased text without accents
+RULES = {
+    "juros": (r"juros|taxa de juros|\d+(?:,\d+)?\s*%(?: ao (?:mes|ano))?", 2.0),
+    "rotativo": (r"rotativo|saldo devedor|financiamento do saldo", 2.0),
+    "pagamento_minimo": (r"pagamento minimo|valor minimo", 2.0),
+    "tarifas": (r"tarifas?|anuidade|encargos?|iof|custo efetivo total|\bcet\b", 2.0),
+    "mora": (r"multa|mora\b|moratori|inadimpl|atraso", 2.0),
+    "parcelamento": (r"parcelamento|parcelad", 1.0),
+    "cancelamento": (r"cancela|rescis|bloque|suspen", 1.5),
+    "alteracao": (r"alterac|reajust|unilateral", 1.5),
+    "responsabilidade": (r"responsabili|indeniz|isent|prejuizo", 1.5),
+    "debito": (r"debito automatico|debitar|compensa", 1.5),
+    "foro": (r"\bforo\b|arbitragem|jurisdic", 1.5),
+    "dados": (r"dados pessoais|compartilh|sigilo", 1.0),
+    "limite": (r"limite", 1.0),
+    "prazo": (r"prazo|vencimento", 0.5),
+}
+
+# Words frequent in any regulation text that say nothing about risk
+GENERIC_TERMS = {
+    "caso", "sera", "serao", "deve", "devem", "devera", "deverao", "pode", "podem", "partir",
+    "demais", "forma", "sobre", "base", "trata", "inclusive", "quando", "cada", "disposto",
+    "resolucao", "banco", "central", "conselho", "monetario", "nacional", "artigo", "presente",
+    "referentes", "referencia", "seja", "mesmo", "apenas", "desse", "dessa", "esta", "este",
+}
+
+
+def _fold(text: str) -> str:
+    folded = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in folded if not unicodedata.combining(c))
+
+
+def derive_terms(references: dict, limit: int = MAX_DERIVED_TERMS) -> list:
+    """Return the vocabulary shared by the regulations in {name: {page_num: text}}.
+
+    Terms in at least half of the references are kept, ranked by how many of
+    their sections use them.
+    """
+    section_freq, reference_freq = Counter(), Counter()
+    for pages in references.values():
+        seen = set()
+        for text in pages.values():
+            for section in split_sections(text):
+                terms = {t for t in tokenize(section) if len(t) > 3 and t.isalpha()}
+                section_freq.update(terms)
+                seen |= terms
+        reference_freq.update(seen)
+    min_references = max(1, len(references) // 2)
+    candidates = [
+        term for term, _ in section_freq.most_common()
+        if reference_freq[term] >= min_references and term not in GENERIC_TERMS | STOPWORDS
+    ]
+    return candidates[:limit]
+
+
+class ClauseScreen:
+    """Local pre-screen that forwards only clauses likely to yield findings.
+
+    Each clause is scored with one compiled pattern holding every rule (weighted
+    by risk topic) and the keywords derived from the regulations. Like
+    ContractRevision, `candidate_pages(pages)` passes the contract through with
+    the clauses scoring below `min_score` removed; they are kept in `skipped`
+    so they can be reported. `pack(chunks)` then merges the thinned chunks so
+    skipping clauses also saves model calls.
+    """
+
+    def __init__(self, terms=(), min_score: float = PRESCREEN_MIN_SCORE):
+        self.min_score = min_score
+        groups = [f"(?P<{name}>{pattern})" for name, (pattern, _) in RULES.items()]
+        if terms:
+            alternatives = "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+            groups.append(rf"(?P<term>\b(?:{alternatives})\b)")
+        self.pattern = re.compile("|".join(groups))
+        self.candidate_clauses = 0
+        self.skipped = []
+        self.pages_seen = 0
+        self.chars_seen = 0
+
+    def score(self, clause: str) -> tuple:
+        """Return (score, matched rules and terms) of a clause"""
+        rules, terms = set(), set()
+        for match in self.pattern.finditer(_fold(clause)):
+            if match.lastgroup == "term":
+                terms.add(match.group())
+            else:
+                rules.add(match.lastgroup)
+        score = sum(RULES[rule][1] for rule in rules) + min(MAX_TERM_SCORE, TERM_WEIGHT * len(terms))
+        return score, sorted(rules) + sorted(terms)
+
+    def candidate_pages(self, contract_pages):
+        """Yield (page_num, text of candidate clauses) for (page_num, text) pairs or a dict"""
+        if isinstance(contract_pages, dict):
+            contract_pages = contract_pages.items()
+        for page, text in contract_pages:
+            self.pages_seen += 1
+            self.chars_seen += len(text)
+            clauses = split_clauses(text)
+            kept = []
+            for clause in clauses:
+                score, _ = self.score(clause)
+                if score >= self.min_score:
+                    kept.append(clause)
+                else:
+                    self.skipped.append({"page": page, "score": score, "text": clause})
+            self.candidate_clauses += len(kept)
+            if len(kept) == len(clauses):
+                yield page, text
+            else:
+                # Pages without candidates are still yielded, empty, so chunking keeps advancing
+                yield page, "\n".join(kept)
+
+    def pack(self, chunks, pages_per_chunk: int):
+        """Merge consecutive screened chunks while their text fits in what one unscreened chunk held"""
+        packed, size = {}, 0
+        for chunk in chunks:
+            chunk = {page: text for page, text in chunk.items() if text}
+            chunk_size = sum(len(text) for text in chunk.values())
+            # Calibrated on the pages seen so far, which includes this chunk's
+            max_chars = pages_per_chunk * self.chars_seen / max(1, self.pages_seen)
+            if packed and size + chunk_size > max_chars:
+                yield packed
+                packed, size = {}, 0
+            packed.update(chunk)
+            size += chunk_size
+        if packed:
+            yield packed
+
+    def report(self) -> dict:
+        return {
+            "min_score": self.min_score,
+            "candidate_clauses": self.candidate_clauses,
+            "skipped_clauses": len(self.skipped),
+            "skipped_chars": sum(len(item["text"]) for item in self.skipped),
+            "skipped": self.skipped,
+        }
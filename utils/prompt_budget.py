@@ -0,0 +1,154 @@
+import os
+from dataclasses import dataclass, field
+
+from utils.text_segments import split_clauses, split_sections
+from utils.tokens import estimate_tokens
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "32000"))
+# Passages joined by retrieval are separated by this marker
+GAP_MARKER = "[...]"
+PREVIEW_CHARS = 80
+
+
+@dataclass
+class PromptPlan:
+    """A prompt packed to a token budget, with the sections that did not fit"""
+
+    prompt: str
+    tokens: int
+    budget: int
+    contract_pages: dict
+    regulations: dict
+    dropped: list = field(default_factory=list)
+
+    @property
+    def dropped_tokens(self) -> int:
+        return sum(item["tokens"] for item in self.dropped)
+
+    def describe_dropped(self) -> list:
+        return [
+            f"{item['source']} p. {item['page']} (~{item['tokens']} tokens): {item['preview']}"
+            for item in self.dropped
+        ]
+
+
+def _page_sections(text: str, splitter) -> list:
+    """Split page text into [(section, gap_before)], keeping retrieval gaps"""
+    sections = []
+    for passage_idx, passage in enumerate((text or "").split(f"\n{GAP_MARKER}\n")):
+        for section_idx, section in enumerate(splitter(passage)):
+            sections.append((section, passage_idx > 0 and section_idx == 0))
+    return sections
+
+
+def _join(sections: list, kept: set) -> str:
+    """Rejoin the kept sections of a page, marking where text was left out"""
+    parts = []
+    skipped = False
+    for idx, (section, gap_before) in enumerate(sections):
+        if idx not in kept:
+            skipped = True
+            continue
+        if parts and (skipped or gap_before):
+            parts.append(GAP_MARKER)
+        parts.append(section)
+        skipped = False
+    return "\n".join(parts)
+
+
+def _rebuild(pages: dict, sections: dict, kept: dict) -> dict:
+    """Return {page_num: text} with only the kept sections; untouched pages keep their text"""
+    rebuilt = {}
+    for page, text in pages.items():
+        if len(kept[page]) == len(sections[page]):
+            if sections[page]:
+                rebuilt[page] = text
+        elif kept[page]:
+            rebuilt[page] = _join(sections[page], kept[page])
+    return rebuilt
+
+
+def _dropped(source: str, page, section: str, tokens: int) -> dict:
+    preview = " ".join(section.split())
+    if len(preview) > PREVIEW_CHARS:
+        preview = preview[:PREVIEW_CHARS].rstrip() + "…"
+    return {"source": source, "page": page, "tokens": tokens, "preview": preview}
+
+
+def _interleave(groups: list) -> list:
+    """Round-robin over the groups so no single reference crowds out the others"""
+    ordered = []
+    for depth in range(max((len(g) for g in groups), default=0)):
+        ordered.extend(g[depth] for g in groups if depth < len(g))
+    return ordered
+
+
+def plan_prompt(template: str, contract_pages: dict, regulations: dict, format_text,
+                budget: int = PROMPT_TOKEN_BUDGET, reserved_tokens: int = 0) -> PromptPlan:
+    """Pack contract pages and regulatory sections into `template` within `budget` tokens.
+
+    The contract has priority: it is only trimmed, clause by clause from its end, when
+    it does not fit on its own. Regulatory text is split at article (or numbered
+    section) boundaries and packed round-robin across references, earlier sections
+    first, until the budget is used up. `format_text(contract_pages, regulations)`
+    renders the document text that replaces {document_text} in the template.
+    `reserved_tokens` are taken by other parts of the request, e.g. attached PDFs.
+    """
+    # Fixed cost of the template and headers, plus "Page N:" labels and reference names
+    used = reserved_tokens + estimate_tokens(format_text({}, {})) + estimate_tokens(
+        template.replace("{document_text}", "")
+    )
+    page_label = estimate_tokens("Page 1:")
+    dropped = []
+
+    contract_sections = {page: _page_sections(text, split_clauses) for page, text in contract_pages.items()}
+    contract_kept = {page: set() for page in contract_pages}
+    overflowed = False
+    for page, sections in contract_sections.items():
+        for idx, (section, _) in enumerate(sections):
+            cost = estimate_tokens(section) + (0 if contract_kept[page] else page_label)
+            overflowed = overflowed or used + cost > budget
+            if overflowed:
+                dropped.append(_dropped("Contract", page, section, estimate_tokens(section)))
+            else:
+                contract_kept[page].add(idx)
+                used += cost
+
+    regulation_sections = {
+        name: {page: _page_sections(text, split_sections) for page, text in pages.items()}
+        for name, pages in regulations.items()
+    }
+    regulation_kept = {name: {page: set() for page in pages} for name, pages in regulations.items()}
+    candidates = _interleave([
+        [(name, page, idx, section) for page, sections in pages.items() for idx, (section, _) in enumerate(sections)]
+        for name, pages in regulation_sections.items()
+    ])
+    for name, page, idx, section in candidates:
+        kept_pages = regulation_kept[name]
+        cost = estimate_tokens(section)
+        if not kept_pages[page]:
+            cost += page_label
+            if not any(kept_pages.values()):
+                cost += estimate_tokens(name)
+        if used + cost <= budget:
+            kept_pages[page].add(idx)
+            used += cost
+        else:
+            dropped.append(_dropped(name, page, section, estimate_tokens(section)))
+
+    trimmed_contract = _rebuild(contract_pages, contract_sections, contract_kept)
+    trimmed_regulations = {}
+    for name, pages in regulations.items():
+        kept_pages = _rebuild(pages, regulation_sections[name], regulation_kept[name])
+        if kept_pages:
+            trimmed_regulations[name] = kept_pages
+
+    prompt = template.replace("{document_text}", format_text(trimmed_contract, trimmed_regulations))
+    return PromptPlan(
+        prompt=prompt,
+        tokens=reserved_tokens + estimate_tokens(prompt),
+        budget=budget,
+        contract_pages=trimmed_contract,
+        regulations=trimmed_regulations,
+        dropped=dropped
+    )
@@ -0,0 +1,74 @@
+import hashlib
+import re
+from pathlib import Path
+
+from utils.pdf_cache import file_hash
+
+# Jaccard similarity of word shingles above which two references are the same regulation
+NEAR_DUPLICATE_THRESHOLD = 0.9
+SHINGLE_SIZE = 5
+# Documents with fewer shingles (scanned or nearly empty PDFs) are only grouped by content hash
+MIN_SHINGLES = 20
+
+
+def text_fingerprint(text_by_page: dict) -> set:
+    """Return the set of hashed word shingles of a document's normalized text"""
+    text = " ".join(text_by_page[page] or "" for page in sorted(text_by_page))
+    words = re.findall(r"\w+", text.lower())
+    return {
+        hashlib.blake2b(" ".join(words[i:i + SHINGLE_SIZE]).encode(), digest_size=8).digest()
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def build_registry(paths, extract_texts, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> list:
+    """Collapse reference PDFs into logical references.
+
+    Byte-identical files are grouped by content hash without being parsed. The
+    remaining distinct files are compared by text fingerprint so re-exported
+    copies of the same regulation are merged too. Each logical reference keeps
+    the other file names as aliases. Files with too little text to fingerprint,
+    such as scanned PDFs, are never merged by text. `extract_texts(paths)` returns
+    {path: {page_num: text}} for the distinct files in one batch.
+    """
+    by_hash = {}
+    for path in sorted(Path(p) for p in paths):
+        by_hash.setdefault(file_hash(path), []).append(path)
+    texts = extract_texts([str(group[0]) for group in by_hash.values()])
+
+    references = []
+    for content_hash, group in by_hash.items():
+        canonical, *duplicates = group
+        fingerprint = text_fingerprint(texts[str(canonical)])
+
+        match = None
+        if len(fingerprint) >= MIN_SHINGLES:
+            match = next(
+                (
+                    ref for ref in references
+                    if len(ref["fingerprint"]) >= MIN_SHINGLES and jaccard(ref["fingerprint"], fingerprint) >= threshold
+                ),
+                None
+            )
+        if match:
+            match["aliases"].extend(p.stem for p in group)
+            match["content_hashes"].append(content_hash)
+            continue
+
+        references.append({
+            "name": canonical.stem,
+            "path": str(canonical),
+            "aliases": [p.stem for p in duplicates],
+            "content_hashes": [content_hash],
+            "fingerprint": fingerprint,
+        })
+
+    for ref in references:
+        del ref["fingerprint"]
+    return references
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from utils.prompt_budget import PROMPT_TOKEN_BUDGET, plan_prompt
+from utils.tokens import estimate_tokens
+
+SUMMARY_DIR = Path(os.getenv("REFERENCE_SUMMARY_DIR", ".cache/reference_summaries"))
+SUMMARY_SCHEMA_PATH = Path("res_schema_reference.json")
+PROMPT_PATH = Path("prompts/reference_analysis.md")
+# Bump when the prompt or schema changes so summaries are rebuilt
+SUMMARY_VERSION = 1
+SUMMARY_FIELDS = ("document_type", "purpose", "summary")
+LIST_FIELDS = ("articles", "obligations", "penalties")
+
+
+def load_summary_schema() -> dict:
+    with open(SUMMARY_SCHEMA_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+SUMMARY_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": load_summary_schema(),
+}
+
+
+def load_summary(content_hash: str):
+    """Return the stored summary record of a reference, or None if it has not been built"""
+    try:
+        record = json.loads((SUMMARY_DIR / f"{content_hash}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return record if record.get("version") == SUMMARY_VERSION else None
+
+
+def store_summary(content_hash: str, name: str, model_name: str, summary: dict) -> dict:
+    record = {
+        "version": SUMMARY_VERSION,
+        "content_hash": content_hash,
+        "name": name,
+        "model": model_name,
+        "built_at": datetime.now().isoformat(),
+        "summary": summary,
+    }
+    SUMMARY_DIR.mkdir(parents=True, exist_ok=True)
+    path = SUMMARY_DIR / f"{content_hash}.json"
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return record
+
+
+def parse_summary(text: str) -> dict:
+    """Parse a summary response, dropping list items without text or a valid page.
+
+    Raises ValueError if the response is not a JSON object.
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("reference summary must be a JSON object")
+
+    summary = {field: str(data.get(field) or "").strip() for field in SUMMARY_FIELDS}
+    for field in LIST_FIELDS:
+        text_key = "summary" if field == "articles" else "text"
+        items = []
+        for item in data.get(field) or []:
+            if not isinstance(item, dict) or not str(item.get(text_key) or "").strip():
+                continue
+            try:
+                page = int(item.get("page"))
+            except (TypeError, ValueError):
+                continue
+            items.append({
+                "article": str(item.get("article") or "").strip(),
+                "page": page,
+                text_key: item[text_key].strip(),
+            })
+        summary[field] = items
+    return summary
+
+
+def merge_summaries(parts: list) -> dict:
+    """Combine the summaries of the parts of a long reference"""
+    merged = {field: parts[0][field] for field in SUMMARY_FIELDS}
+    merged["summary"] = "\n\n".join(part["summary"] for part in parts if part["summary"])
+    for field in LIST_FIELDS:
+        merged[field] = [item for part in parts for item in part[field]]
+    return merged
+
+
+def _format_pages(_, regulations: dict) -> str:
+    return "\n".join(
+        f"Page {page}: {text}" for pages in regulations.values() for page, text in pages.items()
+    )
+
+
+def page_batches(pages: dict, max_tokens: int) -> list:
+    """Group consecutive pages into batches of at most `max_tokens` estimated tokens"""
+    batches, current, used = [], {}, 0
+    for page, text in pages.items():
+        cost = estimate_tokens(f"Page {page}: {text}")
+        if current and used + cost > max_tokens:
+            batches.append(current)
+            current, used = {}, 0
+        current[page] = text
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def summarize_reference(name: str, pages: dict, model, budget: int = PROMPT_TOKEN_BUDGET) -> dict:
+    """Run the reference analysis over a regulation, in parts when it exceeds the token budget"""
+    template = PROMPT_PATH.read_text(encoding="utf-8")
+    available = budget - estimate_tokens(template)
+    parts = []
+    for batch in page_batches(pages, available):
+        # A single page larger than the budget is trimmed at article boundaries
+        plan = plan_prompt(template, {}, {name: batch}, _format_pages, budget)
+        parts.append(parse_summary(model.generate(plan.prompt)))
+    return merge_summaries(parts)
+
+
+def summary_context(summary: dict) -> dict:
+    """Render a summary as compact {page_num: text} regulatory context for the analysis prompt"""
+    lines_by_page = {}
+    for article in summary["articles"]:
+        lines_by_page.setdefault(article["page"], []).append(f"{article['article']}: {article['summary']}")
+    for field, label in (("obligations", "Obrigação"), ("penalties", "Penalidade")):
+        for item in summary[field]:
+            source = f" ({item['article']})" if item["article"] else ""
+            lines_by_page.setdefault(item["page"], []).append(f"{label}{source}: {item['text']}")
+
+    context = {}
+    overview = " ".join(summary[field] for field in SUMMARY_FIELDS if summary[field])
+    if overview:
+        context[min(lines_by_page, default=1)] = overview
+    for page in sorted(lines_by_page):
+        lines = "\n".join(lines_by_page[page])
+        context[page] = f"{context[page]}\n{lines}" if page in context else lines
+    return context
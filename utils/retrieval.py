@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+from utils.text_segments import split_clauses, split_sections
+
+logger = logging.getLogger(__name__)
+
+# Bump when chunking or tokenization changes so persisted indexes are rebuilt
+INDEX_VERSION = 1
+INDEX_DIR = Path(os.getenv("RETRIEVAL_INDEX_DIR", ".cache/retrieval"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+MAX_PASSAGES = int(os.getenv("RETRIEVAL_MAX_PASSAGES", "40"))
+
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e", "em", "entre",
+    "essa", "esse", "esta", "este", "for", "mais", "na", "nas", "no", "nos", "o", "os", "ou",
+    "para", "pela", "pelas", "pelo", "pelos", "por", "que", "se", "sem", "ser", "sua", "suas",
+    "seu", "seus", "um", "uma", "the", "of", "and",
+}
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, strip accents and drop stopwords"""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]+", folded) if t not in STOPWORDS and len(t) > 1]
+
+
+class BM25Index:
+    """Okapi BM25 over regulatory passages"""
+
+    def __init__(self, passages: list, term_freqs: list = None, k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.term_freqs = term_freqs or [Counter(tokenize(p["text"])) for p in passages]
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    @classmethod
+    def from_references(cls, references: dict):
+        """Build an index from {reference_name: {page_num: text}}"""
+        passages = []
+        for name, pages in references.items():
+            for page, text in pages.items():
+                for section in split_sections(text):
+                    passages.append({"reference": name, "page": int(page), "text": section})
+        return cls(passages)
+
+    def search(self, query: str, top_k: int = TOP_K, references=None) -> list:
+        """Return [(score, passage)] for the best matches, optionally limited to some references"""
+        terms = set(tokenize(query)) & self.idf.keys()
+        if not terms:
+            return []
+        scores = []
+        for idx, tf in enumerate(self.term_freqs):
+            if references is not None and self.passages[idx]["reference"] not in references:
+                continue
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[idx] / (self.avg_length or 1))
+            score = sum(
+                self.idf[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm)
+                for t in terms if t in tf
+            )
+            if score > 0:
+                scores.append((score, idx))
+        scores.sort(reverse=True)
+        return [(score, self.passages[idx]) for score, idx in scores[:top_k]]
+
+    def to_dict(self) -> dict:
+        return {"passages": self.passages, "term_freqs": [dict(tf) for tf in self.term_freqs]}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["passages"], [Counter(tf) for tf in data["term_freqs"]])
+
+
+def index_key(reference_hashes: dict) -> str:
+    """Key an index on the reference names and their content hashes"""
+    payload = json.dumps([INDEX_VERSION, sorted(reference_hashes.items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load_or_build_index(reference_hashes: dict, load_references) -> BM25Index:
+    """Load the persisted index for these references, building and saving it on a miss.
+
+    `reference_hashes` maps reference names to content hashes and `load_references(names)`
+    returns {name: {page_num: text}}; it is only called when the index is rebuilt.
+    """
+    path = INDEX_DIR / f"{index_key(reference_hashes)}.json"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return BM25Index.from_dict(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Rebuilding unreadable retrieval index {path}: {e}")
+
+    index = BM25Index.from_references(load_references(list(reference_hashes)))
+    try:
+        INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Failed to persist retrieval index {path}: {e}")
+    return index
+
+
+def retrieve_context(index: BM25Index, contract_pages: dict, references=None,
+                     top_k: int = TOP_K, max_passages: int = MAX_PASSAGES) -> dict:
+    """Retrieve the top-k passages for every contract clause.
+
+    At most `max_passages` distinct passages are kept, best scores first. Returns
+    {reference_name: {page_num: text}} with the matched passages of each page
+    joined in document order, ready to be formatted like full reference text.
+    """
+    selected = {}
+    for page_text in contract_pages.values():
+        for clause in split_clauses(page_text):
+            for score, passage in index.search(clause, top_k, references):
+                key = (passage["reference"], passage["page"], passage["text"])
+                selected[key] = max(score, selected.get(key, 0))
+
+    best = sorted(selected, key=selected.get, reverse=True)[:max_passages]
+    order = {(p["reference"], p["page"], p["text"]): i for i, p in enumerate(index.passages)}
+    context = {}
+    for key in sorted(best, key=order.get):
+        reference, page, text = key
+        pages = context.setdefault(reference, {})
+        pages[page] = f"{pages[page]}\n[...]\n{text}" if page in pages else text
+    return context
@@ -0,0 +1,111 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+RISK_LEVELS = ("high", "medium")
+SCHEMA_PATH = Path("res_schema_a.json")
+
+
+class StatementValidationError(ValueError):
+    """Raised when a statement does not match the response schema"""
+
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+@dataclass
+class Statement:
+    """One validated item of the model's `list_of_statements`"""
+
+    verbatim_text: str
+    risk_level: str
+    risk_reason: str
+    lower_risk_text_suggestion: str
+    page_location: int
+
+    @classmethod
+    def from_dict(cls, item) -> "Statement":
+        if not isinstance(item, dict):
+            raise StatementValidationError([f"statement must be an object, got {type(item).__name__}"])
+
+        errors = []
+        for field in ("verbatim_text", "risk_reason", "lower_risk_text_suggestion"):
+            if not isinstance(item.get(field), str) or not item[field].strip():
+                errors.append(f"{field} must be a non-empty string")
+
+        risk_level = str(item.get("risk_level", "")).strip().lower()
+        if risk_level not in RISK_LEVELS:
+            errors.append(f"risk_level must be one of {', '.join(RISK_LEVELS)}, got {item.get('risk_level')!r}")
+
+        page = item.get("page_location")
+        try:
+            page = None if isinstance(page, bool) else int(page)
+        except (TypeError, ValueError):
+            page = None
+        if page is None or page < 1:
+            errors.append(f"page_location must be a positive integer, got {item.get('page_location')!r}")
+
+        if errors:
+            raise StatementValidationError(errors)
+        return cls(
+            verbatim_text=item["verbatim_text"],
+            risk_level=risk_level,
+            risk_reason=item["risk_reason"],
+            lower_risk_text_suggestion=item["lower_risk_text_suggestion"],
+            page_location=page
+        )
+
+    def as_finding(self) -> dict:
+        """Convert to the finding format rendered by the app"""
+        return {
+            "text": self.verbatim_text,
+            "suggestion": self.lower_risk_text_suggestion,
+            "analysis": self.risk_reason,
+            "page": self.page_location,
+            "source": "main"
+        }
+
+
+def load_response_schema() -> dict:
+    """Load the response schema passed to the model for constrained JSON output"""
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_response(text: str):
+    """Parse a model response into (statements, invalid) where invalid is [(item, errors)].
+
+    Raises json.JSONDecodeError if the response is not JSON at all and
+    StatementValidationError if it has no `list_of_statements` array.
+    """
+    # Schema-constrained responses are plain JSON, but cached or fallback ones may be fenced
+    cleaned = text.strip().replace("```json", "").replace("```", "").strip()
+    data = json.loads(cleaned)
+    if not isinstance(data, dict) or not isinstance(data.get("list_of_statements"), list):
+        raise StatementValidationError(["response must be an object with a list_of_statements array"])
+
+    statements, invalid = [], []
+    for item in data["list_of_statements"]:
+        try:
+            statements.append(Statement.from_dict(item))
+        except StatementValidationError as e:
+            invalid.append((item, e.errors))
+    return statements, invalid
+
+
+def build_repair_prompt(invalid: list) -> str:
+    """Ask the model to fix only the statements that failed validation"""
+    problems = "\n\n".join(
+        f"Statement:\n{json.dumps(item, ensure_ascii=False, indent=2)}\nErrors:\n"
+        + "\n".join(f"- {error}" for error in errors)
+        for item, errors in invalid
+    )
+    return (
+        "The following statements from a contract compliance analysis do not match the "
+        "required format. Correct only the listed errors, keeping the original content, and "
+        "return them as a JSON object with a 'list_of_statements' array. Each statement must "
+        "have verbatim_text, risk_level ('high' or 'medium'), risk_reason, "
+        "lower_risk_text_suggestion and page_location (a positive integer).\n\n"
+        f"{problems}\n\nAll the responses should be in Portuguese."
+    )
@@ -0,0 +1,67 @@
+import json
+
+
+class StatementStreamParser:
+    """Incrementally extract completed items of the `list_of_statements` array.
+
+    Feed the response text as it streams in; every call returns the statement
+    objects whose closing brace has arrived since the previous call. Anything
+    around the JSON (markdown fences, prose) is ignored.
+    """
+
+    KEY = '"list_of_statements"'
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        items = []
+        if self.done:
+            return items
+
+        if not self.in_array:
+            key_at = self.buffer.find(self.KEY)
+            if key_at < 0:
+                return items
+            bracket_at = self.buffer.find("[", key_at + len(self.KEY))
+            if bracket_at < 0:
+                return items
+            self.in_array = True
+            self.pos = bracket_at + 1
+
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0 and char == "{":
+                    self.item_start = self.pos
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0 and char == "]":
+                    self.done = True
+                    break
+                self.depth -= 1
+                if self.depth == 0 and self.item_start is not None:
+                    try:
+                        items.append(json.loads(self.buffer[self.item_start:self.pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+            self.pos += 1
+        return items
@@ -0,0 +1,49 @@
+import re
+
+# Numbered contract clauses such as "4.", "4.2" or "4.4.1." starting a line
+CLAUSE_START = re.compile(r"(?m)^[ \t]*(?=\d{1,3}(?:\.\d{1,3})*\.?[ \t]+[A-ZÀ-Ý])")
+# Articles of a regulation ("Art. 1º", "Art. 12.")
+ARTICLE_START = re.compile(r"(?m)^[ \t]*(?=Art\.\s*\d)")
+
+DEFAULT_MAX_CHARS = 2000
+
+
+def _split_at(pattern, text: str) -> list:
+    starts = [m.start() for m in pattern.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(starts))]
+
+
+def _bound(segment: str, max_chars: int) -> list:
+    """Split an oversized segment at line boundaries"""
+    if len(segment) <= max_chars:
+        return [segment]
+    parts, current = [], ""
+    for line in segment.splitlines(keepends=True):
+        if current and len(current) + len(line) > max_chars:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _segments(pattern, text: str, max_chars: int) -> list:
+    segments = []
+    for segment in _split_at(pattern, text or ""):
+        segments.extend(_bound(segment, max_chars))
+    return [s.strip() for s in segments if s.strip()]
+
+
+def split_clauses(text: str, max_chars: int = DEFAULT_MAX_CHARS) -> list:
+    """Split contract text into numbered clauses"""
+    return _segments(CLAUSE_START, text, max_chars)
+
+
+def split_sections(text: str, max_chars: int = DEFAULT_MAX_CHARS) -> list:
+    """Split regulatory text at article boundaries, or numbered headings when there are no articles"""
+    pattern = ARTICLE_START if ARTICLE_START.search(text or "") else CLAUSE_START
+    return _segments(pattern, text, max_chars)
@@ -0,0 +1,15 @@
+import math
+import re
+
+# Words split into roughly 4-character subword pieces; punctuation counts as one token each
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the model token count of a text without a network tokenizer"""
+    if not text:
+        return 0
+    return sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _TOKEN_PATTERN.findall(text)
+    )
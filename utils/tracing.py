@@ -0,0 +1,135 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """A timed stage of a run with free-form attributes (sizes, token counts, cache hits)"""
+
+    def __init__(self, name: str, parent_id: int = None, **attrs):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = dict(attrs)
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def incr(self, key: str, amount: int = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+
+class Trace:
+    """All spans recorded during one analysis run"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "spans": [
+                {
+                    "id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "thread": span.thread,
+                    "start_s": round(span.start - self.start, 6),
+                    "duration_s": round(span.duration, 6),
+                    "attrs": span.attrs,
+                }
+                for span in sorted(self.spans, key=lambda s: s.start)
+            ],
+        }
+
+    def to_chrome_trace(self) -> dict:
+        """Export in the Chrome trace event format (chrome://tracing, Perfetto)"""
+        threads = {}
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": round((span.start - self.start) * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": 1,
+                "tid": tid,
+                "args": span.attrs,
+            })
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}}
+            for thread, tid in threads.items()
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"run": self.name}}
+
+    def summary(self) -> dict:
+        """Total duration, count and summed numeric attributes per span name"""
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(span.name, {"count": 0, "duration_s": 0.0})
+            stage["count"] += 1
+            stage["duration_s"] = round(stage["duration_s"] + span.duration, 6)
+            for key, value in span.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[key] = stage.get(key, 0) + value
+        return stages
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+
+@contextmanager
+def start_trace(name: str):
+    """Record every span opened in this context (and contexts copied from it) into a new trace"""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a stage of the current trace; a detached span is yielded when no trace is active"""
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+
+
+def current_span():
+    """Return the innermost open span, or None"""
+    return _current_span.get()